@@ -0,0 +1,19 @@
+# Benchmarks for screenpen. Run as modules, e.g. `python -m benchmarks.stroke`.
+# They use the offscreen Qt platform so no display is needed.
+import os
+import sys
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+
+# Kept for the lifetime of the process; a QApplication nobody references is
+# destroyed, and the pixmaps created after that abort.
+_APP = None
+
+
+def get_app():
+    global _APP
+    from PyQt6.QtWidgets import QApplication
+    if _APP is None:
+        _APP = QApplication.instance() or QApplication(sys.argv[:1])
+    return _APP
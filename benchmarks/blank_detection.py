@@ -0,0 +1,39 @@
+# Blank-screen detection in the PyQt capture fallback: the old per-pixel
+# Python scan vs the NumPy check in _is_uniform.
+import importlib
+import time
+from itertools import groupby
+
+from benchmarks import get_app
+
+
+def _is_uniform_per_pixel(imgs) -> bool:
+    # The detection _get_screens used before.
+    pxls = [img.pixel(i, j) for img in imgs for i in range(img.width()) for j in range(img.height())]
+    return [next(g, f := next(g, g)) == f for g in [groupby(pxls)]][0]
+
+
+def run(width: int = 1920, height: int = 1080):
+    get_app()
+    # Imported up front so its import time is not counted.
+    _ = importlib.import_module('numpy')
+    from PyQt6.QtGui import QImage
+    from screenpen.screenpen import _is_uniform, IMAGE_FORMATS
+
+    img = QImage(width, height, IMAGE_FORMATS['ARGB32'])
+    img.fill(0xff000000)
+    results = {}
+    for name, fun in [('per_pixel', _is_uniform_per_pixel), ('numpy', _is_uniform)]:
+        start = time.perf_counter()
+        uniform = fun([img])
+        results[name] = time.perf_counter() - start
+        assert uniform
+
+    print(f'Uniform check of a {width}x{height} screen')
+    for name, elapsed in results.items():
+        print(f'{name:>10} {elapsed * 1000:>10.1f} ms')
+    return results
+
+
+if __name__ == '__main__':
+    _ = run()
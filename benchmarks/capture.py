@@ -0,0 +1,47 @@
+# Capture-to-pixmap time per screenshot backend. Backends that are not
+# available on this system (no Pillow, no grim, no display) are skipped.
+# Unlike the other benchmarks this needs a real display: run it with
+# QT_QPA_PLATFORM set to your platform (e.g. xcb or wayland), otherwise the
+# offscreen default only exercises the pyqt backend.
+import time
+
+from benchmarks import get_app
+
+
+def run(repeat: int = 5):
+    app = get_app()
+    from screenpen.screenpen import (
+        ScreenshotError, CAPTURE_TIMINGS,
+        _get_screenshots_pillow, _get_screenshots_grim, _get_screenshots_pyqt,
+    )
+
+    backends = {
+        'pillow': _get_screenshots_pillow,
+        'grim': _get_screenshots_grim,
+        'pyqt': _get_screenshots_pyqt,
+    }
+    results = {}
+    for name, capture in backends.items():
+        times: list[float] = []
+        try:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                _ = capture(app.screens())
+                times.append(time.perf_counter() - start)
+        except (ScreenshotError, ImportError) as err:
+            print(f'{name}: skipped ({err})')
+            continue
+        results[name] = {
+            'total_ms': 1000 * min(times),
+            'per_screen_ms': [1000 * t for t in CAPTURE_TIMINGS.get(name, [])],
+        }
+
+    print(f'Best of {repeat} capture-to-pixmap times for {len(app.screens())} screen(s)')
+    for name, res in results.items():
+        per_screen = ', '.join(f'{t:.1f}' for t in res['per_screen_ms'])
+        print(f'{name:>8} {res["total_ms"]:>10.1f} ms  per screen: [{per_screen}]')
+    return results
+
+
+if __name__ == '__main__':
+    _ = run()
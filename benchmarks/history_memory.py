@@ -0,0 +1,75 @@
+# Memory held by DrawingHistory over 500 strokes: full-screen snapshots (the
+# old implementation) vs per-stroke tile snapshots vs the vector command log
+# alone. Tiles are shared copy-on-write between snapshots, so the tile figure
+# is an upper bound. The snapshot figure is an estimate, not a measurement:
+# holding 500 full-screen pixmaps would need several GB, so it is 4 bytes per
+# screen pixel times the number of strokes.
+import random
+
+from benchmarks import get_app
+
+RESOLUTIONS = {
+    '1080p': (1920, 1080),
+    '4K': (3840, 2160),
+}
+
+
+def _random_stroke(rng: random.Random, width: int, height: int, points: int = 40):
+    from PyQt6.QtCore import QPoint
+    x, y = rng.randrange(width), rng.randrange(height)
+    stroke = [QPoint(x, y)]
+    for _ in range(points):
+        x = min(max(x + rng.randint(-15, 15), 0), width - 1)
+        y = min(max(y + rng.randint(-15, 15), 0), height - 1)
+        stroke.append(QPoint(x, y))
+    return stroke
+
+
+def run(strokes: int = 500, pen_width: int = 3):
+    get_app()
+    from PyQt6 import QtGui
+    from PyQt6.QtCore import QRect, QSize
+    from screenpen.screenpen import DrawCommand, DrawingHistory, PatchRecorder, StrokeEngine, TiledCanvas
+
+    pen = QtGui.QPen(QtGui.QColor('red'))
+    pen.setWidth(pen_width)
+    margin = pen_width // 2 + 2
+    results = {}
+
+    for name, (width, height) in RESOLUTIONS.items():
+        rng = random.Random(0)
+        canvas = TiledCanvas(QSize(width, height))
+        history = DrawingHistory(strokes)
+
+        for _ in range(strokes):
+            points = _random_stroke(rng, width, height)
+            recorder = PatchRecorder(canvas)
+            stroke = StrokeEngine(points[0])
+            for point in points[1:]:
+                bounds = QRect(stroke.last_point, point).normalized().adjusted(-margin, -margin, margin, margin)
+                recorder.touch(bounds)
+                segment = stroke.add_points(pen, [point])
+                if segment is not None:
+                    path, seg_pen = segment
+                    def _draw(qp, path=path, seg_pen=seg_pen):
+                        qp.setPen(seg_pen)
+                        qp.drawPath(path)
+                    canvas.paint(bounds, _draw)
+            cmd = DrawCommand('drawPath', stroke.points, pen, breaks=stroke.breaks)
+            cmd.patch = recorder.commit()
+            history.append(cmd)
+
+        # The old history kept one full-screen pixmap per stroke.
+        full = strokes * width * height * 4
+        commands = sum(cmd.nbytes() for cmd in history.history)
+        results[name] = {'full_snapshots_estimate': full, 'patches': history.nbytes(), 'commands': commands}
+
+    print(f'DrawingHistory memory after {strokes} strokes')
+    print(f'{"screen":>8} {"full, est. (MB)":>16} {"tiles (MB)":>14} {"commands (MB)":>14}')
+    for name, res in results.items():
+        print(f'{name:>8} {res["full_snapshots_estimate"]/2**20:>16.1f} {res["patches"]/2**20:>14.1f} {res["commands"]/2**20:>14.3f}')
+    return results
+
+
+if __name__ == '__main__':
+    _ = run()
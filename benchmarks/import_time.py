@@ -0,0 +1,55 @@
+# Import cost of the application module, measured with `python -X importtime`
+# in fresh interpreters. Exits non-zero when the median exceeds the budget, so it
+# can guard against regressions, e.g. `python -m benchmarks.import_time --budget 150`.
+# `--module screenpen` measures what `screenpen --send` pays before connecting.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+DEFAULT_BUDGET_MS = 160.0
+
+
+def _import_times(module: str) -> dict[str, tuple[float, float]]:
+    """Runs one fresh import of `module`; returns {module: (self ms, cumulative ms)}."""
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        env=os.environ.copy(),
+    ).stderr.decode()
+
+    times = {}
+    for line in out.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return times
+
+
+def run(module: str = 'screenpen.screenpen', repeat: int = 7, top: int = 10) -> float:
+    _ = _import_times(module)  # warm up the bytecode cache
+    runs = [_import_times(module) for _ in range(repeat)]
+    totals = [times[module][1] for times in runs]
+    median = statistics.median(totals)
+
+    print(f'import {module}: median {median:.1f} ms, min {min(totals):.1f} ms, max {max(totals):.1f} ms over {repeat} runs')
+    print(f'Top {top} modules by self time (last run):')
+    for name, (self_ms, cumulative_ms) in sorted(runs[-1].items(), key=lambda item: -item[1][0])[:top]:
+        print(f'{self_ms:>10.1f} ms {cumulative_ms:>10.1f} ms  {name}')
+    return median
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_MS, help='Maximum median import time in ms.')
+    _ = parser.add_argument('--repeat', type=int, default=7)
+    _ = parser.add_argument('--module', default='screenpen.screenpen', help='Module to import.')
+    args = parser.parse_args()
+
+    median = run(args.module, repeat=args.repeat)
+    if median > args.budget:
+        print(f'FAIL: import time {median:.1f} ms exceeds the budget of {args.budget:.1f} ms')
+        sys.exit(1)
+    print(f'OK: within the budget of {args.budget:.1f} ms')
@@ -0,0 +1,95 @@
+# Frame-paced input: a freehand stroke from a 125 Hz, 500 Hz and 1000 Hz mouse,
+# delivered in real time with the event loop running. Compares handing every
+# move to the stroke immediately (one canvas raster and repaint per event) with
+# the window's frame pacing (all moves since the last frame in one batch).
+# Both keep every point; frame pacing needs far fewer rasters and paints.
+import math
+import time
+
+from benchmarks import get_app
+
+RATES = [125, 500, 1000]
+
+
+def _stroke(window, app, rate: int, duration: float, per_event: bool) -> dict:
+    from PyQt6.QtCore import QEvent, QObject, QPointF, Qt
+    from PyQt6.QtGui import QMouseEvent
+
+    class PaintCounter(QObject):
+            def __init__(self):
+                super().__init__()
+                self.paints: int = 0
+
+            def eventFilter(self, a0, a1):
+                if a1 is not None and a1.type() == QEvent.Type.Paint:
+                    self.paints += 1
+                return False
+
+    left, no_button, no_modifier = Qt.MouseButton.LeftButton, Qt.MouseButton.NoButton, Qt.KeyboardModifier.NoModifier
+    width, height = window.width(), window.height()
+    def _event(kind: QEvent.Type, idx: int, button, buttons) -> QMouseEvent:
+        t = idx / rate
+        pos = QPointF(width / 2 + 0.4 * width * math.cos(3 * t), height / 2 + 0.4 * height * math.sin(5 * t))
+        return QMouseEvent(kind, pos, pos, button, buttons, no_modifier)
+
+    counter = PaintCounter()
+    window.installEventFilter(counter)
+    frames = window.input_frames
+    events = int(rate * duration)
+    handler_time = 0.0
+
+    window.mousePressEvent(_event(QEvent.Type.MouseButtonPress, 0, left, left))
+    app.processEvents()
+    start = time.perf_counter()
+    for idx in range(1, events):
+        delay = start + idx / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        t0 = time.perf_counter()
+        window.mouseMoveEvent(_event(QEvent.Type.MouseMove, idx, no_button, left))
+        if per_event:
+            window.flushInput()
+        app.processEvents()
+        handler_time += time.perf_counter() - t0
+    points = window.stroke.points.size() if window.stroke is not None else 0
+    window.mouseReleaseEvent(_event(QEvent.Type.MouseButtonRelease, events - 1, left, no_button))
+    app.processEvents()
+    window.removeEventFilter(counter)
+
+    return {
+        'events': events,
+        'points': points,
+        'rasters': window.input_frames - frames,
+        'paints': counter.paints,
+        'busy_ms': 1000 * handler_time,
+    }
+
+
+def run(duration: float = 1.0):
+    app = get_app()
+    from PyQt6.QtGui import QPixmap
+    from screenpen.screenpen import ScreenPenWindow
+
+    screen = app.primaryScreen()
+    geom = screen.geometry()
+    pixmap = QPixmap(geom.size())
+    pixmap.fill()
+    window = ScreenPenWindow(screen, geom, pixmap, transparent_background=False)
+    window.hide_menus()
+    app.processEvents()
+
+    print(f'{duration:.1f} s stroke, display refresh {1 / window.frame_interval:.0f} Hz')
+    print(f'{"rate":>8} {"mode":>12} {"events":>8} {"points":>8} {"rasters":>8} {"paints":>8} {"busy ms":>9}')
+    results = {}
+    for rate in RATES:
+        for mode in ['per_event', 'frame_paced']:
+            result = _stroke(window, app, rate, duration, mode == 'per_event')
+            results[(rate, mode)] = result
+            print(f'{rate:>6}Hz {mode:>12} {result["events"]:>8} {result["points"]:>8} {result["rasters"]:>8} '
+                  f'{result["paints"]:>8} {result["busy_ms"]:>9.1f}')
+    window.close()
+    return results
+
+
+if __name__ == '__main__':
+    _ = run()
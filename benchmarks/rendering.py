@@ -0,0 +1,213 @@
+# Drawing performance of ScreenPenWindow: scripted mouse input for every tool
+# at 1080p, 1440p and 4K. Reports the latency from a mouse move to its painted
+# frame (the damaged region only, as in the real event loop), the commit cost
+# (mouseReleaseEvent), undo/redo latency (also with the undo patches dropped,
+# i.e. replaying from the nearest checkpoint) and peak RSS, and writes them as JSON
+# to track regressions between releases:
+#
+#     python -m benchmarks.rendering --output rendering.json
+#
+# Each resolution runs in its own process with an offscreen screen of that
+# size, so the peak RSS is per resolution.
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RESOLUTIONS = {
+    '1080p': (1920, 1080),
+    '1440p': (2560, 1440),
+    '4K': (3840, 2160),
+}
+
+# name: (window action, draws a freehand stroke)
+TOOLS = {
+    'drawPath': ('drawPath', True),
+    'drawEraser': ('drawEraser', True),
+    'highlighter': ('drawPath', True),
+    'drawRect': ('drawRect', False),
+    'drawLine': ('drawLine', False),
+    'drawDot': ('drawDot', False),
+}
+
+
+def _percentiles(times: list[float]) -> dict[str, float]:
+    ms = sorted(1000 * t for t in times)
+    if len(ms) < 2:
+        return {'p50': ms[0], 'p90': ms[0], 'p99': ms[0], 'max': ms[0], 'mean': ms[0]}
+    q = statistics.quantiles(ms, n=100, method='inclusive')
+    return {'p50': q[49], 'p90': q[89], 'p99': q[98], 'max': ms[-1], 'mean': statistics.mean(ms)}
+
+
+def _stroke_points(width: int, height: int, n: int, phase: float):
+    from PyQt6.QtCore import QPoint
+    cx, cy = width / 2, height / 2
+    return [QPoint(int(cx + 0.4 * width * math.sin(i / 45 + phase)), int(cy + 0.4 * height * math.sin(i / 31 + 2 * phase)))
+            for i in range(n)]
+
+
+def _drag_points(width: int, height: int, n: int, phase: float):
+    from PyQt6.QtCore import QPoint
+    x0, y0 = int(width * (0.1 + 0.1 * phase)), int(height * (0.1 + 0.1 * phase))
+    return [QPoint(x0 + i * width // (2 * n), y0 + i * height // (2 * n)) for i in range(n)]
+
+
+def run_resolution(name: str, strokes: int = 5, points: int = 400) -> dict:
+    """Benchmarks one resolution; the offscreen screen must already have that size."""
+    from benchmarks import get_app
+    app = get_app()
+    from PyQt6.QtCore import QEvent, QPointF, Qt
+    from PyQt6.QtGui import QColor, QMouseEvent, QPixmap
+    from screenpen.screenpen import ScreenPenWindow
+
+    screen = app.primaryScreen()
+    geom = screen.geometry()
+    pixmap = QPixmap(geom.size())
+    pixmap.fill(QColor('#336699'))
+    window = ScreenPenWindow(screen, geom, pixmap, transparent_background=False)
+    window.hide_menus() # keep the toolbars out of the way of the injected clicks
+    app.processEvents()
+    width, height = window.width(), window.height()
+
+    left, no_button, no_modifier = Qt.MouseButton.LeftButton, Qt.MouseButton.NoButton, Qt.KeyboardModifier.NoModifier
+    def _event(kind: QEvent.Type, point, button, buttons) -> QMouseEvent:
+        return QMouseEvent(kind, QPointF(point), QPointF(point), button, buttons, no_modifier)
+
+    tools = {}
+    for tool, (action, freehand) in TOOLS.items():
+        window.setAction(action)()
+        if tool == 'drawEraser':
+            window.setEraser()()
+        if tool == 'highlighter':
+            window.setHighlight()()
+
+        paint_times: list[float] = []
+        commit_times: list[float] = []
+        for idx in range(strokes):
+            if freehand:
+                script = _stroke_points(width, height, points, idx)
+            else:
+                script = _drag_points(width, height, points // 4, idx)
+            window.mousePressEvent(_event(QEvent.Type.MouseButtonPress, script[0], left, left))
+            app.processEvents()
+            for point in script[1:]:
+                start = time.perf_counter()
+                window.mouseMoveEvent(_event(QEvent.Type.MouseMove, point, no_button, left))
+                window.flushInput() # one frame per move, instead of waiting for the frame timer
+                app.processEvents() # delivers the update request, i.e. paintEvent
+                paint_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            window.mouseReleaseEvent(_event(QEvent.Type.MouseButtonRelease, script[-1], left, no_button))
+            app.processEvents()
+            commit_times.append(time.perf_counter() - start)
+
+        if tool == 'highlighter':
+            window.setHighlight()()
+        tools[tool] = {
+            'paint_ms': _percentiles(paint_times),
+            'commit_ms': _percentiles(commit_times),
+        }
+
+    undo_times: list[float] = []
+    redo_times: list[float] = []
+    steps = window.history.len()
+    for times, step in [(undo_times, window.undo), (redo_times, window.redo)]:
+        for _ in range(steps):
+            start = time.perf_counter()
+            step()
+            app.processEvents()
+            times.append(time.perf_counter() - start)
+
+    # What undo costs once the memory budget has dropped the patches.
+    rebuild_times: list[float] = []
+    for cmd in window.history.history:
+        cmd.patch = None
+    for _ in range(steps):
+        start = time.perf_counter()
+        window.undo()
+        app.processEvents()
+        rebuild_times.append(time.perf_counter() - start)
+
+    result = {
+        'width': width,
+        'height': height,
+        'device_pixel_ratio': window.canvas_dpr,
+        'tools': tools,
+        'undo_ms': _percentiles(undo_times),
+        'redo_ms': _percentiles(redo_times),
+        'rebuild_ms': _percentiles(rebuild_times),
+        # ru_maxrss is in KiB on Linux and in bytes on macOS.
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10),
+    }
+    window.close()
+    return result
+
+
+def _run_child(name: str, strokes: int, points: int) -> dict:
+    print(f'Running {name}...', file=sys.stderr)
+    width, height = RESOLUTIONS[name]
+    with tempfile.TemporaryDirectory(prefix='screenpen-bench-') as tmp:
+        screens = os.path.join(tmp, 'screens.json')
+        with open(screens, 'w') as fp:
+            json.dump({'screens': [{'name': name, 'x': 0, 'y': 0, 'width': width, 'height': height,
+                                    'logicalDpi': 96, 'logicalBpi': 96, 'dpr': 1}]}, fp)
+        env = {**os.environ, 'QT_QPA_PLATFORM': f'offscreen:configfile={screens}'}
+        out = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.rendering', '--child', name, '--strokes', str(strokes), '--points', str(points)],
+            check=True, env=env, stdout=subprocess.PIPE,
+        ).stdout.decode()
+    # The window prints informational messages; the result is the last line.
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(resolutions: list[str] | None = None, strokes: int = 5, points: int = 400) -> dict:
+    from PyQt6.QtCore import PYQT_VERSION_STR, QT_VERSION_STR
+    from screenpen.screenpen import __version__
+
+    report = {
+        'screenpen': __version__,
+        'python': platform.python_version(),
+        'qt': QT_VERSION_STR,
+        'pyqt': PYQT_VERSION_STR,
+        'strokes': strokes,
+        'points': points,
+        'results': {name: _run_child(name, strokes, points) for name in (resolutions or list(RESOLUTIONS))},
+    }
+
+    for name, result in report['results'].items():
+        print(f'{name} ({result["width"]}x{result["height"]}), peak RSS {result["peak_rss_mb"]:.0f} MB')
+        print(f'{"":>12} {"paint p50":>10} {"p90":>8} {"p99":>8} {"max":>8} {"commit p50":>11}')
+        for tool, times in result['tools'].items():
+            paint, commit = times['paint_ms'], times['commit_ms']
+            print(f'{tool:>12} {paint["p50"]:>10.3f} {paint["p90"]:>8.3f} {paint["p99"]:>8.3f} {paint["max"]:>8.3f} {commit["p50"]:>11.3f}')
+        print(f'{"undo":>12} {result["undo_ms"]["p50"]:>10.3f} {result["undo_ms"]["p90"]:>8.3f} {result["undo_ms"]["p99"]:>8.3f} {result["undo_ms"]["max"]:>8.3f}')
+        print(f'{"redo":>12} {result["redo_ms"]["p50"]:>10.3f} {result["redo_ms"]["p90"]:>8.3f} {result["redo_ms"]["p99"]:>8.3f} {result["redo_ms"]["max"]:>8.3f}')
+        print(f'{"rebuild":>12} {result["rebuild_ms"]["p50"]:>10.3f} {result["rebuild_ms"]["p90"]:>8.3f} {result["rebuild_ms"]["p99"]:>8.3f} {result["rebuild_ms"]["max"]:>8.3f}')
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument('--output', '-o', help='Write the results as JSON to this file.')
+    _ = parser.add_argument('--resolution', action='append', choices=list(RESOLUTIONS), help='Only run these resolutions.')
+    _ = parser.add_argument('--strokes', type=int, default=5, help='Strokes per tool.')
+    _ = parser.add_argument('--points', type=int, default=400, help='Mouse moves per freehand stroke (a quarter for shapes).')
+    _ = parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(run_resolution(args.child, args.strokes, args.points)))
+        sys.exit(0)
+
+    report = run(args.resolution, args.strokes, args.points)
+    if args.output is not None:
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+        print(f'Wrote {args.output}')
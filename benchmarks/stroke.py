@@ -0,0 +1,61 @@
+# Frame time of freehand strokes: incremental StrokeEngine vs redrawing the
+# whole path every frame (the old behaviour).
+import math
+import time
+
+from benchmarks import get_app
+
+
+def _points(n: int):
+    from PyQt6.QtCore import QPoint
+    return [QPoint(int(960 + 800*math.cos(i/50)), int(540 + 400*math.sin(i/37))) for i in range(n)]
+
+
+def run(n: int = 10000, bucket: int = 1000):
+    get_app()
+    from PyQt6 import QtGui
+    from PyQt6.QtGui import QImage, QPainter, QPainterPath
+    from screenpen.screenpen import StrokeEngine, COMPOSITION_MODE, _path_move_to, _path_cubic_to
+
+    pen = QtGui.QPen(QtGui.QColor('red'))
+    pen.setWidth(3)
+    points = _points(n)
+    results = {}
+
+    for name in ['incremental', 'full_path']:
+        img = QImage(1920, 1080, QImage.Format.Format_ARGB32)
+        img.fill(0)
+        stroke = StrokeEngine(points[0])
+        path = QPainterPath()
+        _path_move_to(path, points[0])
+        times: list[float] = []
+        for point in points[1:]:
+            start = time.perf_counter()
+            qp = QPainter(img)
+            qp.setCompositionMode(COMPOSITION_MODE['source'])
+            if name == 'incremental':
+                segment = stroke.add_points(pen, [point])
+                if segment is not None:
+                    qp.setPen(segment[1])
+                    qp.drawPath(segment[0])
+            else:
+                _path_cubic_to(path, point, point, point)
+                qp.setPen(pen)
+                qp.drawPath(path)
+            _ = qp.end()
+            times.append(time.perf_counter() - start)
+
+        results[name] = [
+            1000 * sum(times[i:i+bucket]) / len(times[i:i+bucket])
+            for i in range(0, len(times), bucket)
+        ]
+
+    print(f'Mean frame time (ms) per {bucket} points of a {n} point stroke')
+    print(f'{"points":>8} {"incremental":>12} {"full_path":>12}')
+    for idx, (inc, full) in enumerate(zip(results['incremental'], results['full_path'])):
+        print(f'{(idx+1)*bucket:>8} {inc:>12.3f} {full:>12.3f}')
+    return results
+
+
+if __name__ == '__main__':
+    _ = run()
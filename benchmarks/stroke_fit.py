@@ -0,0 +1,122 @@
+# Commit-time stroke fitting (_fit_stroke): how far freehand strokes shrink and
+# how far the fitted curve strays from what was drawn, per tolerance. The
+# deviation is the Hausdorff distance between the drawn polyline and the
+# flattened fitted curve, sampled every 0.2 px. Exits non-zero when a curve
+# strays further than its tolerance (plus the sampling error), e.g.
+#
+#     python -m benchmarks.stroke_fit --tolerance 0.5 --tolerance 1
+import argparse
+import math
+import random
+import sys
+import time
+
+from benchmarks import get_app
+
+TOLERANCES = [0.5, 1.0, 2.0, 4.0]
+STEP = 0.2
+
+
+def _mouse_strokes(count: int, points: int) -> list[list[tuple[int, int]]]:
+    """Hand-like strokes: smooth loops sampled like a 1000 Hz mouse, i.e. a pixel or two apart and rounded to integers."""
+    rng = random.Random(1)
+    strokes = []
+    for _ in range(count):
+        a, b = rng.uniform(1, 2), rng.uniform(1, 2)
+        phase = rng.uniform(0, math.pi)
+        stroke = []
+        for idx in range(points):
+            t = idx / points * 2 * math.pi
+            stroke.append((round(960 + 300 * math.sin(a * t + phase)), round(540 + 200 * math.sin(b * t))))
+        strokes.append([point for idx, point in enumerate(stroke) if idx == 0 or point != stroke[idx - 1]])
+    return strokes
+
+
+def _sample(polyline: list[tuple[float, float]]) -> list[tuple[float, float]]:
+    samples = [polyline[0]]
+    for (ax, ay), (bx, by) in zip(polyline, polyline[1:]):
+        steps = max(1, math.ceil(math.hypot(bx - ax, by - ay) / STEP))
+        samples.extend((ax + (bx - ax) * i / steps, ay + (by - ay) * i / steps) for i in range(1, steps + 1))
+    return samples
+
+
+def _directed_distance(source: list[tuple[float, float]], target: list[tuple[float, float]]) -> float:
+    """Largest distance from a sample of the `source` polyline to the `target` polyline."""
+    from screenpen.screenpen import _segment_distance2
+    cell = 2.0
+    grid: dict[tuple[int, int], list[tuple[tuple[float, float], tuple[float, float]]]] = {}
+    for start, end in zip(target, target[1:]):
+        for gx in range(int(min(start[0], end[0]) // cell), int(max(start[0], end[0]) // cell) + 1):
+            for gy in range(int(min(start[1], end[1]) // cell), int(max(start[1], end[1]) // cell) + 1):
+                grid.setdefault((gx, gy), []).append((start, end))
+    worst = 0.0
+    for x, y in _sample(source):
+        cx, cy = int(x // cell), int(y // cell)
+        best = math.inf
+        radius = 1
+        # Segments further than `radius - 1` cells away cannot be closer.
+        while best > ((radius - 1) * cell) ** 2:
+            for gx in range(cx - radius, cx + radius + 1):
+                for gy in range(cy - radius, cy + radius + 1):
+                    for start, end in grid.get((gx, gy), ()):
+                        best = min(best, _segment_distance2(x, y, start, end))
+            radius += 1
+        worst = max(worst, best)
+    return math.sqrt(worst)
+
+
+def run(tolerances: list[float], strokes: int = 5, points: int = 2000) -> dict:
+    get_app()
+    from PyQt6.QtCore import QPoint
+    from PyQt6.QtGui import QPolygon
+    from screenpen.screenpen import DrawCommand, _fit_stroke
+
+    data = _mouse_strokes(strokes, points)
+    results = {}
+    print(f'{strokes} strokes of ~{points} mouse positions')
+    print(f'{"tolerance":>10} {"points":>8} {"segments":>9} {"bytes":>8} {"fitted":>8} {"reduction":>10} {"max dev":>8} {"fit ms":>8}')
+    for tolerance in tolerances:
+        raw_points = segments = raw_bytes = fitted_bytes = 0
+        deviation = 0.0
+        fit_times: list[float] = []
+        for stroke in data:
+            polygon = QPolygon([QPoint(x, y) for x, y in stroke])
+            start = time.perf_counter()
+            path = _fit_stroke(polygon, tolerance)
+            fit_times.append(time.perf_counter() - start)
+
+            raw_points += polygon.size()
+            segments += (path.elementCount() - 1) // 3
+            raw_bytes += DrawCommand('drawPath', polygon).nbytes()
+            fitted_bytes += DrawCommand('drawPath', polygon, path=path).nbytes()
+
+            drawn = [(float(x), float(y)) for x, y in stroke]
+            fitted = [(point.x(), point.y()) for polyline in path.toSubpathPolygons() for point in polyline]
+            deviation = max(deviation, _directed_distance(drawn, fitted), _directed_distance(fitted, drawn))
+
+        results[tolerance] = {
+            'points': raw_points,
+            'segments': segments,
+            'bytes': raw_bytes,
+            'fitted_bytes': fitted_bytes,
+            'max_deviation': deviation,
+            'fit_ms': 1000 * max(fit_times),
+        }
+        print(f'{tolerance:>10.2f} {raw_points:>8} {segments:>9} {raw_bytes:>8} {fitted_bytes:>8} '
+              f'{raw_bytes / fitted_bytes:>9.1f}x {deviation:>8.2f} {1000 * max(fit_times):>8.1f}')
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    _ = parser.add_argument('--tolerance', type=float, action='append', help='Tolerances in pixels to measure.')
+    _ = parser.add_argument('--strokes', type=int, default=5)
+    _ = parser.add_argument('--points', type=int, default=2000)
+    args = parser.parse_args()
+
+    results = run(args.tolerance or TOLERANCES, args.strokes, args.points)
+    failed = [tolerance for tolerance, result in results.items() if result['max_deviation'] > tolerance + STEP]
+    if failed:
+        print(f'FAIL: fitted curves deviate further than the tolerance for {failed}')
+        sys.exit(1)
+    print('OK: every fitted curve is within its tolerance')
@@ -0,0 +1,42 @@
+# Tool-switch latency: building the cursor on every switch (the old
+# behaviour, emulated by emptying the cursor cache) vs the CursorCache.
+import statistics
+import time
+
+from benchmarks import get_app
+
+
+def run(switches: int = 2000):
+    app = get_app()
+    from PyQt6.QtGui import QPixmap
+    from screenpen.screenpen import ScreenPenWindow
+
+    screen = app.primaryScreen()
+    geom = screen.geometry()
+    pixmap = QPixmap(geom.size())
+    pixmap.fill()
+    window = ScreenPenWindow(screen, geom, pixmap, transparent_background=False, show=False)
+
+    tools = [window.setEraser(), window.setAction('drawPath'), window.setEraser(), window.setAction('drawRect')]
+    results = {}
+    for name in ['uncached', 'cached']:
+        times: list[float] = []
+        for idx in range(switches):
+            if name == 'uncached':
+                window.cursors.cursors.clear()
+            start = time.perf_counter()
+            tools[idx % len(tools)]()
+            times.append(time.perf_counter() - start)
+        results[name] = times
+
+    print(f'Tool-switch latency over {switches} switches (eraser / pen / eraser / rect)')
+    print(f'{"":>10} {"mean ms":>10} {"p95 ms":>10} {"max ms":>10}')
+    for name, times in results.items():
+        p95 = statistics.quantiles(times, n=20)[-1]
+        print(f'{name:>10} {1000 * statistics.mean(times):>10.4f} {1000 * p95:>10.4f} {1000 * max(times):>10.4f}')
+    window.close()
+    return results
+
+
+if __name__ == '__main__':
+    _ = run()
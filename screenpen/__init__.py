@@ -1,3 +1,3 @@
-from screenpen.screenpen import main
+from screenpen.client import main
 if __name__ == '__main__':
     main()
\ No newline at end of file
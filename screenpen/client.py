@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# SPDX-License-Identifier: GPL-3.0
+# -*- coding: utf-8 -*-
+# ----------------------------------------------------------------------------
+# Command line entry point. Handing a command to a running instance
+# (`screenpen --send ...`, or a plain `screenpen` while a daemon is resident)
+# only needs QtCore and QtNetwork, so the drawing application in
+# screenpen.screenpen is imported only when a new instance starts.
+# ----------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+
+from screenpen.version import __version__
+
+# Commands a second invocation can send to the running instance (--send).
+# `quit` only hides a resident (--daemon) instance, `stop` ends it.
+INSTANCE_COMMANDS = ['show', 'toggle_menus', 'clear', 'save', 'undo', 'redo', 'quit', 'stop']
+
+
+def instance_name() -> str:
+    """Socket name of the running instance.
+
+    Where there is a per-user runtime directory the socket is created in it,
+    which no other user can enter. Otherwise Qt puts it in the temporary
+    directory and only the owner may connect (see
+    screenpen.screenpen.InstanceServer).
+    """
+    import getpass
+    name = f'screenpen-{getpass.getuser()}'
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, name)
+    return name
+
+
+def check_already_running(command: str | None = None):
+    from PyQt6.QtNetwork import QLocalSocket
+    socket = QLocalSocket()
+    socket.connectToServer(instance_name())
+    if not socket.waitForConnected(100):
+        return
+
+    if command is None:
+        sys.exit(-3)
+
+    _ = socket.write(f'{command}\n'.encode())
+    _ = socket.waitForBytesWritten(1000)
+    socket.disconnectFromServer()
+    sys.exit(0)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Process some integers.')
+    _ = parser.add_argument('-v', '--version', dest='version', action='version', version=f'Version: {__version__}')
+    _ = parser.add_argument('-1', nargs='?', type=int, dest='screen', const='0')
+    _ = parser.add_argument('-2', nargs='?', type=int, dest='screen', const='1')
+    _ = parser.add_argument('-3', nargs='?', type=int, dest='screen', const='2')
+    _ = parser.add_argument('-a', '--all-screens', dest='all_screens', action='store_true', help='Open an overlay on every screen. The toolbars are shown on the screen chosen with -1/-2/-3.')
+    _ = parser.add_argument('-t', '--transparent', dest='transparent', help='Force transparent background. If you are sure your WM support it.', action='store_true')
+    _ = parser.add_argument('-c', '--config', type=str, dest='config', help='Path to config file', default='')
+    _ = parser.add_argument('--send', dest='send', choices=INSTANCE_COMMANDS, help='Send a command to the running instance and exit.')
+    _ = parser.add_argument('--daemon', dest='daemon', action='store_true', help='Stay resident with a hidden window. Running screenpen again shows it.')
+    _ = parser.add_argument('--record-trace', dest='record_trace', metavar='FILE', help='Record every input event of the session to FILE.')
+    _ = parser.add_argument('--replay-trace', dest='replay_trace', metavar='FILE',
+                            help='Replay a recorded session headlessly as fast as possible and print frame-time and memory statistics as JSON.')
+    _ = parser.add_argument('--realtime', dest='realtime', action='store_true', help='With --replay-trace, keep the recorded timing.')
+    _ = parser.add_argument('--profile-startup', nargs='?', const='-', dest='profile_startup', metavar='FILE',
+                            help='Time the startup phases, exit after the first frame and write them as JSON to FILE (default: stdout).')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+
+    # A replay runs on its own offscreen screens, next to any running instance.
+    if args.replay_trace is None:
+        # A plain invocation asks a running (possibly resident) instance to show itself.
+        check_already_running(None if args.daemon else (args.send or 'show'))
+        if args.send is not None:
+            print('Error: screenpen is not running.')
+            sys.exit(1)
+
+    from screenpen.screenpen import run
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,38 +8,51 @@
 # Modified by Joseph Enders to better suit my uses. 
 # Removed PyQt5, Matplotlib
 
-import subprocess
+import time
+_IMPORT_START = time.monotonic() # for --profile-startup
+
+# Rarely needed modules (subprocess, configparser, platform, getpass, json,
+# shutil, minidom, datetime, PIL, numpy) are imported where they are used so
+# that starting an instance stays cheap; `screenpen --send` does not import this
+# module at all (see screenpen.client).
 import sys
+import re
 import os
-import configparser
-import platform
-import psutil
+import math
+import zlib
+import threading
 
-from xml.dom import minidom
-from collections.abc import Iterable
-from typing import Callable, override
-from datetime import datetime
-from itertools import groupby
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, override
+from functools import wraps
 
 # Setting up Qt resources
 
 from PyQt6 import QtGui
 from PyQt6 import QtWidgets
 from PyQt6 import QtCore
-from PyQt6.QtWidgets import QMainWindow, QApplication
-from PyQt6.QtCore import QPoint, QRect, Qt, QSize
+from PyQt6.QtCore import QPoint, QPointF, QRect, QRectF, Qt, QSize, QObject, QRunnable, QThreadPool, pyqtSignal, QBuffer, QByteArray
 from PyQt6.QtGui import (
     QGuiApplication, QIcon, QPalette, QColor, QCursor, QPainter,
     QPixmap, QKeySequence, QAction, QShortcut, QImage, QScreen,
-    QMouseEvent, QKeyEvent, QPaintEvent, QPainterPath
+    QMouseEvent, QPaintEvent, QResizeEvent, QTransform, QPainterPath, QPolygon, QImageReader, QRegion
 )
 
 from PyQt6.QtWidgets import (
-    QMainWindow, QApplication, QDialogButtonBox, QLabel, QPushButton, QVBoxLayout, 
-    QPlainTextEdit, QListWidget, QListWidgetItem, QHBoxLayout, QGridLayout, QToolBar, 
-    QDialog, QToolButton, QMenu, QColorDialog, QGraphicsDropShadowEffect
+    QMainWindow, QApplication, QDialogButtonBox, QToolBar, QToolButton,
+    QMenu, QColorDialog
 )
 
+from screenpen.client import check_already_running, instance_name, main
+
+if TYPE_CHECKING:
+    import argparse
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from PyQt6.QtNetwork import QLocalSocket
+
+_IMPORT_END = time.monotonic()
+
 type Color = QColor | Qt.GlobalColor | int
 
 
@@ -139,6 +152,10 @@ POPUP_MODE = {
     'instantPopup': QtWidgets.QToolButton.ToolButtonPopupMode.InstantPopup
 }
 
+APP_ATTRS = {
+    'compressHighFrequencyEvents': Qt.ApplicationAttribute.AA_CompressHighFrequencyEvents,
+}
+
 COMPOSITION_MODE = {
     'source': QPainter.CompositionMode.CompositionMode_Source,
     'source_over': QPainter.CompositionMode.CompositionMode_SourceOver,
@@ -175,6 +192,15 @@ def _path_cubic_to(path, point1, point2, point3):
         point3.x(), point3.y(), 
     )
 
+# config name: (Qt image format, file extension)
+SAVE_FORMATS = {
+    'png': ('PNG', 'png'),
+    'jpg': ('JPEG', 'jpg'),
+    'jpeg': ('JPEG', 'jpg'),
+    'webp': ('WEBP', 'webp'),
+    'bmp': ('BMP', 'bmp'),
+}
+
 DIALOG_BUTTONS = {
     'ok': QDialogButtonBox.StandardButton.Ok,
     'cancel': QDialogButtonBox.StandardButton.Cancel,
@@ -182,23 +208,1184 @@ DIALOG_BUTTONS = {
         
 __version__ = "0.3.3"
 
-class ScreenPenWindow(QMainWindow):
-    def __init__(self, screen: QScreen, screen_geom: QRect, pixmap: QtGui.QPixmap | None = None, transparent_background: bool = True,
-                    config_file: str | None = None): # app: QApplication
-        super().__init__()
+class StartupProfiler():
+    """Collects monotonic timings of the startup phases for --profile-startup."""
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        self.origin: float = _IMPORT_START
+        self.phases: list[dict[str, str | float]] = []
+        self.lock: threading.Lock = threading.Lock()
 
-        dir_path = os.path.dirname(os.path.realpath(__file__))
-        # PATHS
+    def record(self, name: str, start: float, end: float):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.phases.append({
+                'phase': name,
+                'start_ms': 1000 * (start - self.origin),
+                'duration_ms': 1000 * (end - start),
+            })
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.monotonic()
         try:
-            prefix: str = sys._MEIPASS
-            resources_xml_path = os.path.join(prefix, 'utils', 'resources.xml')
-        except:
-            prefix = ''
-            resources_xml_path = os.path.join(dir_path, 'utils', 'resources.xml')
+            yield
+        finally:
+            self.record(name, start, time.monotonic())
+
+    def report(self, path: str = '-'):
+        import json
+        report = json.dumps({
+            'total_ms': 1000 * (time.monotonic() - self.origin),
+            'phases': self.phases,
+        }, indent=2)
+        if path == '-':
+            print(report)
+        else:
+            with open(path, 'w') as fp:
+                _ = fp.write(report)
+
+
+PROFILER = StartupProfiler()
+
+
+type TileKey = tuple[int, int]
+
+
+class TiledCanvas():
+        """A raster layer split into lazily allocated square tiles.
+
+        Tiles that were never drawn on are not allocated and read as
+        `fill_color`. Tiles are QImages, which Qt shares copy-on-write, so
+        snapshots of the canvas only hold references until a tile is drawn on
+        again.
+
+        The canvas is addressed in logical (window) coordinates, but tiles are
+        TILE_SIZE device pixels at `dpr`, so on HiDPI screens strokes are
+        rasterized at native resolution and `render` is an unscaled blit.
+        """
+        TILE_SIZE: int = 256
+
+        def __init__(self, size: QSize, fill_color: Color = COLORS['transparent'], dpr: float = 1.0):
+            self._size: QSize = QSize(size)
+            self.fill_color: QColor = QColor(fill_color)
+            self.dpr: float = dpr
+            self.tiles: dict[TileKey, QImage] = {}
+
+        def size(self) -> QSize:
+            return QSize(self._size)
+
+        def width(self) -> int:
+            return self._size.width()
+
+        def height(self) -> int:
+            return self._size.height()
+
+        def rect(self) -> QRect:
+            return QRect(QPoint(0, 0), self._size)
+
+        def _toDevice(self, rect: QRect) -> QRect:
+            d = self.dpr
+            return QRectF(rect.x() * d, rect.y() * d, rect.width() * d, rect.height() * d).toAlignedRect()
+
+        def _tileDeviceRect(self, key: TileKey) -> QRect:
+            return QRect(key[0] * self.TILE_SIZE, key[1] * self.TILE_SIZE, self.TILE_SIZE, self.TILE_SIZE)
+
+        def tileRect(self, key: TileKey) -> QRect:
+            """Logical rect covered by a tile."""
+            r = self._tileDeviceRect(key)
+            d = self.dpr
+            return QRectF(r.x() / d, r.y() / d, r.width() / d, r.height() / d).toAlignedRect()
+
+        def tileKeys(self, rect: QRect) -> list[TileKey]:
+            rect = self._toDevice(rect.intersected(self.rect())).intersected(self._toDevice(self.rect()))
+            if rect.isEmpty():
+                return []
+            t = self.TILE_SIZE
+            return [
+                (x, y)
+                for y in range(rect.top() // t, rect.bottom() // t + 1)
+                for x in range(rect.left() // t, rect.right() // t + 1)
+            ]
+
+        def _tile(self, key: TileKey) -> QImage:
+            tile = self.tiles.get(key)
+            if tile is None:
+                tile = QtGui.QImage(self.TILE_SIZE, self.TILE_SIZE, IMAGE_FORMATS['ARGB32'])
+                tile.setDevicePixelRatio(self.dpr)
+                tile.fill(self.fill_color)
+                self.tiles[key] = tile
+            return tile
+
+        def fill(self, color: Color):
+            self.fill_color = QColor(color)
+            self.tiles = {}
+
+        def paint(self, rect: QRect, draw: Callable[[QPainter], None], composition: str = 'source', once: bool = True):
+            """Calls `draw` with a painter in canvas coordinates, clipped to `rect`, and stores the result in the tiles.
+
+            With `once`, `draw` is rasterized a single time into a scratch image
+            of `rect` holding the current pixels, which is then copied back into
+            the tiles; that suits paths, whose stroking is the expensive part.
+            Otherwise `draw` runs per tile, clipped to it, which avoids the copies
+            for cheap shapes with large bounds such as rect outlines.
+            """
+            keys = self.tileKeys(rect)
+            if len(keys) == 1 or not once:
+                for key in keys:
+                    tile_rect = self._tileDeviceRect(key)
+                    # The tile's device pixel ratio scales the painter to logical coordinates.
+                    qp = QPainter(self._tile(key))
+                    qp.setCompositionMode(COMPOSITION_MODE[composition])
+                    qp.translate(-tile_rect.x() / self.dpr, -tile_rect.y() / self.dpr)
+                    qp.setClipRect(rect)
+                    draw(qp)
+                    _ = qp.end()
+                return
+
+            device = self._toDevice(rect.intersected(self.rect())).intersected(self._toDevice(self.rect()))
+            scratch = QtGui.QImage(device.size(), IMAGE_FORMATS['ARGB32'])
+            scratch.setDevicePixelRatio(self.dpr)
+            scratch.fill(self.fill_color)
+            qp = QPainter(scratch)
+            qp.setCompositionMode(COMPOSITION_MODE['source'])
+            qp.scale(1 / self.dpr, 1 / self.dpr)
+            for key in keys:
+                tile = self.tiles.get(key)
+                if tile is None:
+                    continue
+                tile_rect = self._tileDeviceRect(key)
+                part = tile_rect.intersected(device)
+                qp.drawImage(QRectF(part.translated(-device.topLeft())), tile, QRectF(part.translated(-tile_rect.topLeft())))
+            # Back to the scratch image's device pixel ratio scaling, i.e. logical coordinates.
+            qp.resetTransform()
+            qp.setCompositionMode(COMPOSITION_MODE[composition])
+            qp.translate(-device.x() / self.dpr, -device.y() / self.dpr)
+            draw(qp)
+            _ = qp.end()
 
-        self.resources_xml: str = resources_xml_path
+            for key in keys:
+                tile_rect = self._tileDeviceRect(key)
+                part = tile_rect.intersected(device)
+                if part == tile_rect:
+                    # Fully covered, so the tile is replaced; snapshots keep the old one.
+                    tile = scratch.copy(part.translated(-device.topLeft()))
+                    tile.setDevicePixelRatio(self.dpr)
+                    self.tiles[key] = tile
+                    continue
+                qp = QPainter(self._tile(key))
+                qp.setCompositionMode(COMPOSITION_MODE['source'])
+                qp.scale(1 / self.dpr, 1 / self.dpr)
+                qp.drawImage(QRectF(part.translated(-tile_rect.topLeft())), scratch, QRectF(part.translated(-device.topLeft())))
+                _ = qp.end()
+
+        def render(self, qp: QPainter, source: QRect):
+            """Draws the part of the canvas in `source` with a painter in canvas coordinates.
+
+            On a paint device with the canvas' device pixel ratio the tiles are
+            copied 1:1.
+            """
+            source = source.intersected(self.rect())
+            if self.fill_color.alpha() > 0:
+                qp.fillRect(source, self.fill_color)
+            device_source = self._toDevice(source)
+            qp.save()
+            qp.scale(1 / self.dpr, 1 / self.dpr)
+            for key in self.tileKeys(source):
+                tile = self.tiles.get(key)
+                if tile is None:
+                    continue
+                tile_rect = self._tileDeviceRect(key)
+                part = tile_rect.intersected(device_source)
+                qp.drawImage(QRectF(part), tile, QRectF(part.translated(-tile_rect.topLeft())))
+            qp.restore()
+
+        def copy(self, rect: QRect | None = None) -> QImage:
+            if rect is None:
+                rect = self.rect()
+            img = QtGui.QImage(self._toDevice(rect).size(), IMAGE_FORMATS['ARGB32'])
+            img.setDevicePixelRatio(self.dpr)
+            img.fill(COLORS['transparent'])
+            qp = QPainter(img)
+            qp.setCompositionMode(COMPOSITION_MODE['source'])
+            qp.translate(-rect.x(), -rect.y())
+            self.render(qp, rect)
+            _ = qp.end()
+            return img
+
+        def snapshot(self, keys: Iterable[TileKey]) -> dict[TileKey, QImage | None]:
+            # QImage(tile) shares the pixel data until either side is drawn on.
+            return {key: QImage(self.tiles[key]) if key in self.tiles else None for key in keys}
+
+        def restore(self, tiles: dict[TileKey, QImage | None]):
+            for key, tile in tiles.items():
+                if tile is None:
+                    _ = self.tiles.pop(key, None)
+                else:
+                    self.tiles[key] = QImage(tile)
+
+
+class StrokeEngine():
+        """Builds a freehand stroke one batch of points at a time.
+
+        `add_points` returns only the segments added by the batch to rasterize,
+        so the cost per frame stays constant however long the stroke gets. The
+        full path is kept for committing the stroke, and `breaks` holds the
+        number of points at the end of each segment, so the stroke can be
+        rasterized again exactly as it was drawn (see DrawCommand.segments).
+        """
+        def __init__(self, start: QPoint):
+            self.path: QPainterPath = QPainterPath()
+            _path_move_to(self.path, start)
+            self.last_point: QPoint = QPoint(start)
+            self.points: QPolygon = QPolygon([start])
+            self.breaks: list[int] = []
+            self.length: float = 0.0
+
+        def add_points(self, pen: QtGui.QPen, points: list[QPoint]) -> tuple[QPainterPath, QtGui.QPen] | None:
+            segment = QPainterPath()
+            _path_move_to(segment, self.last_point)
+            for point in points:
+                if point == self.last_point:
+                    continue
+                _path_cubic_to(segment, point, point, point)
+                _path_cubic_to(self.path, point, point, point)
+                self.points.append(point)
+                self.last_point = QPoint(point)
+            if segment.elementCount() == 1:
+                return None
+
+            if pen.style() != PEN_STYLES['solidLine']:
+                # Continue the dash pattern where the previous segment ended.
+                pen = QtGui.QPen(pen)
+                pen.setDashOffset(self.length / max(pen.widthF(), 1.0))
+
+            self.length += segment.length()
+            self.breaks.append(self.points.size())
+            return segment, pen
+
+
+class CompressedImage():
+        """A QImage packed losslessly into a zlib blob."""
+        def __init__(self, img: QImage):
+            self.width: int = img.width()
+            self.height: int = img.height()
+            self.bytes_per_line: int = img.bytesPerLine()
+            self.format: QImage.Format = img.format()
+            self.dpr: float = img.devicePixelRatio()
+            self.data: bytes = zlib.compress(img.constBits().asstring(img.sizeInBytes()), 1)
+
+        def nbytes(self) -> int:
+            return len(self.data)
+
+        def decompress(self) -> QImage:
+            data = zlib.decompress(self.data)
+            img = QImage(data, self.width, self.height, self.bytes_per_line, self.format).copy()
+            img.setDevicePixelRatio(self.dpr)
+            return img
+
+
+type Tiles = dict[TileKey, QImage | None]
+type StoredTiles = dict[TileKey, QImage | CompressedImage | None]
+
+
+class HistoryPatch():
+        """The canvas tiles one stroke touched, before and after it was drawn."""
+        def __init__(self, rect: QRect, before: Tiles, after: Tiles):
+            self.rect: QRect = rect
+            self._before: StoredTiles = dict(before)
+            self._after: StoredTiles = dict(after)
+            self._compressed: bool = False
+            self._pending: Future[tuple[StoredTiles, StoredTiles]] | None = None
+
+        def _resolve(self):
+            if self._pending is not None and self._pending.done():
+                self._before, self._after = self._pending.result()
+                self._compressed = True
+                self._pending = None
+
+        @staticmethod
+        def _tiles(tiles: StoredTiles) -> Tiles:
+            return {
+                key: tile.decompress() if isinstance(tile, CompressedImage) else tile
+                for key, tile in tiles.items()
+            }
+
+        @staticmethod
+        def _compressTiles(tiles: StoredTiles) -> StoredTiles:
+            return {
+                key: CompressedImage(tile) if isinstance(tile, QImage) else tile
+                for key, tile in tiles.items()
+            }
+
+        @property
+        def before(self) -> Tiles:
+            self._resolve()
+            return self._tiles(self._before)
+
+        @property
+        def after(self) -> Tiles:
+            self._resolve()
+            return self._tiles(self._after)
+
+        @property
+        def compressed(self) -> bool:
+            self._resolve()
+            return self._compressed
+
+        @property
+        def compressing(self) -> bool:
+            self._resolve()
+            return self._pending is not None
+
+        def compress(self, executor: 'ThreadPoolExecutor') -> bool:
+            """Schedules compression on `executor`. Returns False if already compressed or scheduled."""
+            if self._pending is not None or self.compressed:
+                return False
+            before, after = self._before, self._after
+            self._pending = executor.submit(lambda: (self._compressTiles(before), self._compressTiles(after)))
+            return True
+
+        def cacheKeys(self) -> set[int]:
+            """cacheKey() of the tiles kept raw, which share their pixels with every copy."""
+            self._resolve()
+            return {tile.cacheKey() for tiles in (self._before, self._after) for tile in tiles.values() if isinstance(tile, QImage)}
+
+        def nbytes(self, shared: set[int] | None = None) -> int:
+            """Bytes held by the patch, leaving out raw tiles whose cacheKey() is in `shared`."""
+            self._resolve()
+            return sum(
+                tile.nbytes() if isinstance(tile, CompressedImage) else tile.sizeInBytes()
+                for tiles in (self._before, self._after)
+                for tile in tiles.values()
+                if tile is not None and not (shared and isinstance(tile, QImage) and tile.cacheKey() in shared)
+            )
+
+
+class PatchRecorder():
+        """Keeps the tiles of `canvas` that a stroke is about to draw on.
+
+        `touch` must be called with the rect a drawing operation covers before
+        drawing it; `commit` then builds a HistoryPatch for the touched tiles.
+        """
+        def __init__(self, canvas: TiledCanvas):
+            self.canvas: TiledCanvas = canvas
+            self.bounds: QRect = QRect()
+            self.before: Tiles = {}
+
+        def touch(self, rect: QRect):
+            keys = [key for key in self.canvas.tileKeys(rect) if key not in self.before]
+            if not keys:
+                return
+            self.before.update(self.canvas.snapshot(keys))
+            for key in keys:
+                self.bounds = self.bounds.united(self.canvas.tileRect(key))
+
+        def commit(self) -> HistoryPatch | None:
+            if not self.before:
+                return None
+            after = self.canvas.snapshot(self.before.keys())
+            patch = HistoryPatch(self.bounds, self.before, after)
+            self.before = {}
+            return patch
+
+
+type Vec = tuple[float, float]
+type Cubic = tuple[Vec, Vec, Vec, Vec]
+
+
+def _segment_distance2(x: float, y: float, start: Vec, end: Vec) -> float:
+    """Squared distance from (x, y) to the segment start-end."""
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    norm = dx * dx + dy * dy
+    t = 0.0 if norm == 0 else min(max(((x - start[0]) * dx + (y - start[1]) * dy) / norm, 0.0), 1.0)
+    ex, ey = x - start[0] - t * dx, y - start[1] - t * dy
+    return ex * ex + ey * ey
+
+
+def _simplify_polyline(points: list[Vec], tolerance: float) -> list[Vec]:
+    """Ramer-Douglas-Peucker: drops the points that lie within `tolerance` of the kept polyline."""
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    tolerance2 = tolerance * tolerance
+    ranges = [(0, len(points) - 1)]
+    while ranges:
+        first, last = ranges.pop()
+        worst, split = 0.0, -1
+        for idx in range(first + 1, last):
+            # Distance to the segment, not the line, so doubling back is kept.
+            dist2 = _segment_distance2(*points[idx], points[first], points[last])
+            if dist2 > worst:
+                worst, split = dist2, idx
+        if worst > tolerance2:
+            keep[split] = True
+            ranges.append((split, last))
+            ranges.append((first, split))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _unit(x: float, y: float) -> Vec:
+    length = math.hypot(x, y)
+    return (x / length, y / length) if length > 0 else (0.0, 0.0)
+
+
+def _bezier_at(bezier: Cubic, u: float) -> Vec:
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = bezier
+    v = 1 - u
+    b0, b1, b2, b3 = v * v * v, 3 * u * v * v, 3 * u * u * v, u * u * u
+    return (b0 * x0 + b1 * x1 + b2 * x2 + b3 * x3, b0 * y0 + b1 * y1 + b2 * y2 + b3 * y3)
+
+
+def _fit_bezier(points: list[Vec], params: list[float], left: Vec, right: Vec) -> Cubic:
+    """Least-squares cubic through the end points of `points` with the given end tangents."""
+    (x0, y0), (x3, y3) = points[0], points[-1]
+    c00 = c01 = c11 = b0 = b1 = 0.0
+    for (px, py), u in zip(points, params):
+        v = 1 - u
+        w0, w1, w2, w3 = v * v * v, 3 * u * v * v, 3 * u * u * v, u * u * u
+        a0x, a0y = left[0] * w1, left[1] * w1
+        a1x, a1y = right[0] * w2, right[1] * w2
+        c00 += a0x * a0x + a0y * a0y
+        c01 += a0x * a1x + a0y * a1y
+        c11 += a1x * a1x + a1y * a1y
+        rx = px - (w0 + w1) * x0 - (w2 + w3) * x3
+        ry = py - (w0 + w1) * y0 - (w2 + w3) * y3
+        b0 += a0x * rx + a0y * ry
+        b1 += a1x * rx + a1y * ry
+
+    chord = math.hypot(x3 - x0, y3 - y0)
+    det = c00 * c11 - c01 * c01
+    alpha_l = alpha_r = 0.0
+    if abs(det) > 1e-12:
+        alpha_l = (b0 * c11 - b1 * c01) / det
+        alpha_r = (c00 * b1 - c01 * b0) / det
+    if alpha_l < 1e-6 * chord or alpha_r < 1e-6 * chord:
+        # Degenerate fit, fall back to the classic chord/3 handles.
+        alpha_l = alpha_r = chord / 3
+    return ((x0, y0), (x0 + left[0] * alpha_l, y0 + left[1] * alpha_l),
+            (x3 + right[0] * alpha_r, y3 + right[1] * alpha_r), (x3, y3))
+
+
+def _reparameterize(bezier: Cubic, points: list[Vec], params: list[float]) -> list[float]:
+    """One Newton-Raphson step per point towards its closest parameter on `bezier`."""
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = bezier
+    result: list[float] = []
+    for (px, py), u in zip(points, params):
+        v = 1 - u
+        qx, qy = _bezier_at(bezier, u)
+        d1x = 3 * (v * v * (x1 - x0) + 2 * u * v * (x2 - x1) + u * u * (x3 - x2))
+        d1y = 3 * (v * v * (y1 - y0) + 2 * u * v * (y2 - y1) + u * u * (y3 - y2))
+        d2x = 6 * (v * (x2 - 2 * x1 + x0) + u * (x3 - 2 * x2 + x1))
+        d2y = 6 * (v * (y2 - 2 * y1 + y0) + u * (y3 - 2 * y2 + y1))
+        num = (qx - px) * d1x + (qy - py) * d1y
+        den = d1x * d1x + d1y * d1y + (qx - px) * d2x + (qy - py) * d2y
+        result.append(min(max(u - num / den, 0.0), 1.0) if den != 0 else u)
+    return result
+
+
+def _fit_cubics(points: list[Vec], tolerance: float) -> list[Cubic]:
+    """Fits a smooth chain of cubics to `points`, splitting until every point is within `tolerance`.
+
+    Schneider's algorithm (Graphics Gems, 1990): chord-length parameters, a
+    least-squares fit with fixed end tangents, Newton reparameterization, and
+    a split at the worst point with a shared tangent to keep the joint smooth.
+    """
+    if len(points) < 2:
+        return []
+    tolerance2 = tolerance * tolerance
+    cubics: list[Cubic] = []
+    left = _unit(points[1][0] - points[0][0], points[1][1] - points[0][1])
+    right = _unit(points[-2][0] - points[-1][0], points[-2][1] - points[-1][1])
+    ranges = [(0, len(points) - 1, left, right)]
+    while ranges:
+        first, last, left, right = ranges.pop()
+        chunk = points[first:last + 1]
+        (x0, y0), (x3, y3) = chunk[0], chunk[-1]
+        if len(chunk) == 2:
+            # A straight segment; tangent handles could bulge away from the chord.
+            dx, dy = (x3 - x0) / 3, (y3 - y0) / 3
+            cubics.append(((x0, y0), (x0 + dx, y0 + dy), (x3 - dx, y3 - dy), (x3, y3)))
+            continue
 
-        self.config: Configuration = Configuration(config_file)
+        params = [0.0]
+        for (ax, ay), (bx, by) in zip(chunk, chunk[1:]):
+            params.append(params[-1] + math.hypot(bx - ax, by - ay))
+        total = params[-1] or 1.0
+        params = [u / total for u in params]
+
+        for attempt in range(4):
+            bezier = _fit_bezier(chunk, params, left, right)
+            worst, split = 0.0, len(chunk) // 2
+            for idx in range(1, len(chunk)):
+                if idx < len(chunk) - 1:
+                    qx, qy = _bezier_at(bezier, params[idx])
+                    dist2 = (qx - chunk[idx][0]) ** 2 + (qy - chunk[idx][1]) ** 2
+                    if dist2 > worst:
+                        worst, split = dist2, idx
+                # Between two points the curve must stay near the stroke too.
+                qx, qy = _bezier_at(bezier, (params[idx - 1] + params[idx]) / 2)
+                dist2 = _segment_distance2(qx, qy, chunk[idx - 1], chunk[idx])
+                if dist2 > worst:
+                    worst, split = dist2, min(max(idx, 1), len(chunk) - 2)
+            if worst <= tolerance2:
+                cubics.append(bezier)
+                break
+            if worst > 4 * tolerance2 or attempt == 3:
+                center = _unit(chunk[split - 1][0] - chunk[split + 1][0], chunk[split - 1][1] - chunk[split + 1][1])
+                ranges.append((first + split, last, (-center[0], -center[1]), right))
+                ranges.append((first, first + split, left, center))
+                break
+            params = _reparameterize(bezier, chunk, params)
+    return cubics
+
+
+def _fit_stroke(points: QPolygon, tolerance: float) -> QPainterPath:
+    """Simplifies a freehand stroke to a smooth cubic path within about `tolerance` pixels.
+
+    A tenth of the tolerance goes to thinning the points, which mostly drops
+    the straight runs of integer mouse positions; the rest goes to the curve
+    fit, which does the actual reduction.
+    """
+    polyline = _simplify_polyline([(float(points.point(idx).x()), float(points.point(idx).y())) for idx in range(points.size())],
+                                  tolerance / 10)
+    path = QPainterPath()
+    path.moveTo(*polyline[0])
+    for _, c1, c2, end in _fit_cubics(polyline, tolerance * 0.9):
+        path.cubicTo(*c1, *c2, *end)
+    return path
+
+
+class DrawCommand():
+        """One committed drawing operation, kept as vectors.
+
+        The command log is the source of truth for the drawing: imageDraw can
+        be rebuilt from it (and the oldest history checkpoint), at any resolution. `patch` optionally caches the
+        raster before/after of the operation so undo does not need a rebuild.
+        Freehand strokes are fitted to a compact `path` in the background once
+        committed (see simplify), which is then drawn instead of the points.
+        Until then `breaks` (see StrokeEngine) lets a rebuild draw them in the
+        segments they were drawn in live.
+        """
+        def __init__(self, tool: str, points: QPolygon, pen: QtGui.QPen | None = None,
+                     brush: QtGui.QBrush | None = None, composition: str = 'source',
+                     path: QPainterPath | None = None, breaks: list[int] | None = None):
+            self.tool: str = tool
+            self.points: QPolygon = points
+            self.pen: QtGui.QPen | None = QtGui.QPen(pen) if pen is not None else None
+            self.brush: QtGui.QBrush | None = QtGui.QBrush(brush) if brush is not None else None
+            self.composition: str = composition
+            self._path: QPainterPath | None = path
+            self.breaks: list[int] | None = list(breaks) if breaks is not None else None
+            self._pending: Future[QPainterPath] | None = None
+            self.patch: HistoryPatch | None = None
+
+        def _resolve(self):
+            if self._pending is not None and self._pending.done():
+                path = self._pending.result()
+                self._pending = None
+                # Tiny strokes can come out larger than they went in.
+                if 16 * path.elementCount() < 8 * self.points.size():
+                    self._path = path
+                    self.breaks = None
+                    self.points = QPolygon([QPointF(path.elementAt(idx).x, path.elementAt(idx).y).toPoint()
+                                            for idx in range(0, path.elementCount(), 3)])
+
+        @property
+        def path(self) -> QPainterPath | None:
+            self._resolve()
+            return self._path
+
+        def simplify(self, executor: 'ThreadPoolExecutor', tolerance: float) -> bool:
+            """Schedules fitting a freehand stroke to a curve on `executor`. Returns False if there is nothing to fit."""
+            if self.tool not in ['drawPath', 'drawEraser'] or self.points.size() < 3:
+                return False
+            if self._pending is not None or self.path is not None:
+                return False
+            self._pending = executor.submit(_fit_stroke, QPolygon(self.points), tolerance)
+            return True
+
+        def render(self, qp: QPainter):
+            qp.setCompositionMode(COMPOSITION_MODE[self.composition])
+            if self.tool == 'clear':
+                device = qp.device()
+                qp.save()
+                qp.resetTransform()
+                qp.fillRect(QRect(0, 0, device.width(), device.height()), COLORS['transparent'])
+                qp.restore()
+                return
+
+            if self.pen is not None:
+                qp.setPen(self.pen)
+            qp.setBrush(self.brush if self.brush is not None else BRUSHES['no_brush'])
+
+            match self.tool:
+                case 'drawPath' | 'drawEraser':
+                    path = self.path
+                    if path is not None:
+                        qp.drawPath(path)
+                        return
+                    if self.points.size() < 2:
+                        return
+                    path = QPainterPath()
+                    _path_move_to(path, self.points.point(0))
+                    for idx in range(1, self.points.size()):
+                        point = self.points.point(idx)
+                        _path_cubic_to(path, point, point, point)
+                    qp.drawPath(path)
+                case 'drawRect':
+                    qp.drawRect(QRect(self.points.point(0), self.points.point(1)))
+                case 'drawLine':
+                    qp.drawLine(self.points.point(0), self.points.point(1))
+                case 'drawDot':
+                    qp.drawEllipse(self.points.point(0), 10, 10)
+                case _:
+                    raise Exception(f"Error: Unknown drawing command ({self.tool})")
+
+        def segments(self) -> Iterator[tuple[QRect, Callable[[QPainter], None]]]:
+            """The bounds and drawing of each segment of a freehand stroke, as
+            StrokeEngine produced them while it was drawn, so a rebuild gives the
+            same pixels (one path differs at fractional device pixel ratios).
+            Nothing if the stroke was fitted to a curve or has no `breaks`."""
+            if self.path is not None or self.breaks is None or self.pen is None or self.points.size() < 2:
+                return
+            margin = self.pen.width() // 2 + 2
+            stroke = StrokeEngine(self.points.point(0))
+            first = 1
+            for last in self.breaks:
+                points = [self.points.point(idx) for idx in range(first, last)]
+                bounds = QPolygon([stroke.last_point, *points]).boundingRect().adjusted(-margin, -margin, margin, margin)
+                segment = stroke.add_points(self.pen, points)
+                first = last
+                if segment is None:
+                    continue
+                def _draw(qp: QPainter, path: QPainterPath = segment[0], pen: QtGui.QPen = segment[1]):
+                    qp.setBrush(BRUSHES['no_brush'])
+                    qp.setPen(pen)
+                    qp.drawPath(path)
+                yield bounds, _draw
+
+        def bounds(self) -> QRect:
+            margin = (self.pen.width() if self.pen is not None else 0) // 2 + 2
+            if self.tool == 'drawDot':
+                margin += 10
+            path = self.path
+            rect = self.points.boundingRect()
+            if path is not None:
+                # The curve stays inside the hull of its control points.
+                rect = rect.united(path.controlPointRect().toAlignedRect())
+            return rect.adjusted(-margin, -margin, margin, margin)
+
+        def nbytes(self) -> int:
+            # Raster cache not included.
+            path = self.path
+            if path is not None:
+                return 16 * path.elementCount() + 64
+            return 8 * self.points.size() + 8 * len(self.breaks or []) + 64
+
+
+class DrawingHistory():
+        """The command log with the raster caches that make undo cheap.
+
+        Commands keep a HistoryPatch for a plain tile swap on undo. With the
+        `canvas` the commands are drawn on, the whole canvas is kept as well
+        every CHECKPOINT_INTERVAL commands and after every clear (copy-on-write,
+        so only tiles drawn over since cost memory), so undoing a command whose
+        patch was dropped replays the commands after the nearest checkpoint
+        rather than the whole log. Commands up to the oldest checkpoint still
+        needed are dropped; that checkpoint is then kept under index -1, the
+        canvas before the first command of the log.
+        """
+        CHECKPOINT_INTERVAL: int = 8
+
+        def __init__(self, limit: int = 4, memory_limit: int = 0, stroke_tolerance: float = 0.0,
+                     canvas: TiledCanvas | None = None):
+            self.history: list[DrawCommand] = []
+            self.canvas: TiledCanvas | None = canvas
+            # Index of the last command applied -> the canvas after it, as a patch from an empty canvas.
+            self.checkpoints: dict[int, HistoryPatch] = {}
+            self.limit: int = limit
+            self.memory_limit: int = memory_limit # bytes, 0 means no limit
+            self.stroke_tolerance: float = stroke_tolerance # pixels, 0 keeps strokes as drawn
+            self.current: int = -1
+            self.executors: dict[str, ThreadPoolExecutor] = {}
+
+        def _getExecutor(self, job: str) -> 'ThreadPoolExecutor':
+            # One worker per kind of job ('fit', 'compress'), so fitting a long
+            # stroke does not hold up compression and vice versa.
+            if job not in self.executors:
+                from concurrent.futures import ThreadPoolExecutor
+                self.executors[job] = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'screenpen-{job}')
+            return self.executors[job]
+
+        @property
+        def floor(self) -> int:
+            # Commands below this index are kept for rebuilding but cannot be undone.
+            return max(len(self.history) - self.limit, 0)
+
+        def _trim(self, base: int):
+            """Drops the commands up to checkpoint `base`, which becomes checkpoint -1."""
+            if base < 0:
+                return
+            del self.history[:base + 1]
+            self.current -= base + 1
+            self.checkpoints = {index - base - 1: checkpoint for index, checkpoint in self.checkpoints.items()}
+        
+        def append(self, el: DrawCommand):
+            """Adds a command that has already been drawn on the canvas."""
+            del self.history[self.current + 1:]
+            self.checkpoints = {index: checkpoint for index, checkpoint in self.checkpoints.items() if index <= self.current}
+            self.history.append(el)
+            self.current = len(self.history) - 1
+
+            for cmd in self.history[:self.floor]:
+                cmd.patch = None
+            due = el.tool == 'clear' or self.current - max(self.checkpoints, default=-1) >= self.CHECKPOINT_INTERVAL
+            if self.canvas is not None and due:
+                tiles = self.canvas.snapshot(self.canvas.tiles)
+                self.checkpoints[self.current] = HistoryPatch(self.canvas.rect(), dict.fromkeys(tiles), tiles)
+            # Undo goes back to the state after command floor - 1 at most, so
+            # only the newest checkpoint up to there is still needed below it,
+            # and none of the commands up to that checkpoint.
+            base, _ = self.checkpointBefore(self.floor - 1)
+            self.checkpoints = {index: checkpoint for index, checkpoint in self.checkpoints.items() if index >= base}
+            self._trim(base)
+            if self.stroke_tolerance > 0:
+                _ = el.simplify(self._getExecutor('fit'), self.stroke_tolerance)
+            self._enforceBudget()
+
+        def _enforceBudget(self):
+            if self.memory_limit <= 0:
+                return
+            excess = self.nbytes() - self.memory_limit
+            if excess <= 0:
+                return
+
+            # Compress the oldest patches first, then the checkpoints. The
+            # newest patch stays raw so the next undo does not have to
+            # decompress anything. A patch counts at its raw size until its
+            # compression has finished, so all of them are queued.
+            cached = [cmd for cmd in self.history if cmd.patch is not None]
+            compressible = [*(cmd.patch for cmd in cached[:-1]), *self.checkpoints.values()]
+            for patch in compressible:
+                _ = patch.compress(self._getExecutor('compress'))
+
+            # Only once all of them are compressed and they still do not fit,
+            # drop the oldest patches; undo falls back to replaying from the
+            # nearest checkpoint for those. Until then the next commit checks again.
+            if any(patch.compressing for patch in compressible):
+                return
+            # Tiles a dropped patch shared with a checkpoint are then counted
+            # with the checkpoint, which the next commit accounts for.
+            for cmd in cached[:-1]:
+                if excess <= 0:
+                    break
+                if cmd.patch is not None:
+                    excess -= cmd.patch.nbytes()
+                cmd.patch = None
+            
+        def extend(self, l: Iterable[DrawCommand]):
+            for el in l:
+                self.append(el)
+            
+        def undo(self) -> DrawCommand | None:
+            if self.current < self.floor:
+                return None
+            cmd = self.history[self.current]
+            self.current -= 1
+            return cmd
+        
+        def redo(self) -> DrawCommand | None:
+            if self.current + 1 >= len(self.history):
+                return None
+            self.current += 1
+            return self.history[self.current]
+
+        def applied(self) -> list[DrawCommand]:
+            return self.history[:self.current + 1]
+
+        def checkpointBefore(self, index: int) -> tuple[int, HistoryPatch | None]:
+            """The newest checkpoint taken after command `index` or earlier, (-1, None) for the empty canvas."""
+            index = max((key for key in self.checkpoints if key <= index), default=-1)
+            return index, self.checkpoints.get(index)
+
+        def len(self) -> int:
+            return len(self.history)
+
+        def nbytes(self) -> int:
+            patches = [cmd.patch for cmd in self.history if cmd.patch is not None]
+            # Checkpoint tiles still shared with the canvas or a patch cost nothing extra.
+            shared = {tile.cacheKey() for tile in self.canvas.tiles.values()} if self.canvas is not None else set()
+            for patch in patches:
+                shared |= patch.cacheKeys()
+            return (sum(patch.nbytes() for patch in patches)
+                    + sum(checkpoint.nbytes(shared) for checkpoint in self.checkpoints.values()))
+
+        def __getitem__(self, key: int) -> DrawCommand:
+            try:
+                return self.history[-key]
+
+            except KeyError:
+                print(f"Error: Invalid key in history ({key})")
+                sys.exit(-2)
+
+
+class SaveSignals(QObject):
+    finished = pyqtSignal(str, bool)
+
+
+class SaveWorker(QRunnable):
+        """Encodes and writes an image on a QThreadPool thread."""
+        def __init__(self, img: QImage, path: str, fmt: str, compression: int = -1):
+            super().__init__()
+            self.img: QImage = img
+            self.path: str = path
+            self.fmt: str = fmt
+            self.compression: int = compression
+            self.signals: SaveSignals = SaveSignals()
+
+        def _quality(self) -> int:
+            if self.compression < 0:
+                return -1
+            if self.fmt == 'PNG':
+                # Qt maps PNG quality q onto zlib level (100 - q) * 9 // 91.
+                level = min(self.compression, 9)
+                return 100 - math.ceil(level * 91 / 9)
+            return min(self.compression, 100)
+
+        @override
+        def run(self):
+            ok = self.img.save(self.path, self.fmt, self._quality())
+            self.signals.finished.emit(self.path, ok)
+
+
+class IconCache():
+        """Rasterized icons from resources.xml.
+
+        Images are keyed by (name, colours, size, device pixel ratio), kept in
+        memory for the session and stored as PNGs under the XDG cache in a
+        directory named after a hash of resources.xml, so warm launches neither
+        parse the XML nor render SVG.
+        """
+        DEFAULT_COLORS: dict[str, str] = {
+            'STROKE': 'white',
+            'FILL': 'silver',
+        }
+
+        def __init__(self, resources_xml: str, path: str | None = None):
+            self.resources_xml: str = resources_xml
+            self.path: str = path if path is not None else os.path.join(_cache_dir(), 'icons')
+            self.images: dict[tuple[str, tuple[tuple[str, str], ...], int, float], QImage] = {}
+            self._resources: bytes | None = None
+            self._digest: str | None = None
+            self._svgs: dict[str, str] | None = None
+            self._dir_ready: bool = False
+
+        def _read_resources(self) -> bytes:
+            if self._resources is None:
+                try:
+                    with open(self.resources_xml, 'rb') as fp:
+                        self._resources = fp.read()
+                except FileNotFoundError as ex:
+                    print('ERROR: There is no resources.xml file')
+                    raise ex
+            return self._resources
+
+        @property
+        def digest(self) -> str:
+            if self._digest is None:
+                import hashlib
+                self._digest = hashlib.sha1(self._read_resources()).hexdigest()[:16]
+            return self._digest
+
+        @property
+        def svgs(self) -> dict[str, str]:
+            if self._svgs is None:
+                from xml.dom import minidom
+                icons = minidom.parseString(self._read_resources()).getElementsByTagName('icon')
+
+                if len(icons) < 1:
+                    raise Exception('ERROR: there are no icons in resources.xml file')
+
+                self._svgs = {}
+                for icon in icons:
+                    if icon.getAttribute('name')=='':
+                        raise Exception('ERROR: resources.xml: icon doesnt contain "name" attribute')
+
+                    self._svgs[icon.getAttribute('name')] = icon.getElementsByTagName('svg')[0].toxml().replace('\n', '')
+            return self._svgs
+
+        def svg(self, name: str, custom_colors_dict: dict[str, str] | None = None) -> str:
+            colors_dict = {**self.DEFAULT_COLORS, **(custom_colors_dict or {})}
+
+            parsed = self.svgs[name]
+            for el in colors_dict:
+                parsed = parsed.replace(f'{{{el}}}', colors_dict[el])
+
+            return parsed
+
+        def _cached_dir(self) -> str:
+            directory = os.path.join(self.path, self.digest)
+            if not self._dir_ready:
+                self._dir_ready = True
+                # Drop icons rendered from older versions of resources.xml.
+                try:
+                    import shutil
+                    for entry in os.listdir(self.path):
+                        if entry != self.digest:
+                            shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
+                except OSError:
+                    pass
+            return directory
+
+        def _rasterize(self, svg: str, size: int) -> QImage:
+            buffer = QBuffer()
+            buffer.setData(QByteArray(svg.encode('utf-8')))
+            reader = QImageReader(buffer, b'svg')
+            reader.setScaledSize(reader.size().scaled(QSize(size, size), Qt.AspectRatioMode.KeepAspectRatio))
+            return reader.read()
+
+        def image(self, name: str, custom_colors_dict: dict[str, str] | None = None, size: int = 32, dpr: float = 1.0) -> QImage:
+            colors = tuple(sorted({**self.DEFAULT_COLORS, **(custom_colors_dict or {})}.items()))
+            key = (name, colors, size, dpr)
+            img = self.images.get(key)
+            if img is not None:
+                return img
+
+            pixels = max(1, round(size * dpr))
+            colors_id = f'{zlib.crc32(repr(colors).encode()):08x}'
+            directory = self._cached_dir()
+            path = os.path.join(directory, f'{name}-{colors_id}-{pixels}.png')
+            img = QImage(path)
+            if img.isNull():
+                img = self._rasterize(self.svg(name, dict(colors)), pixels)
+                # The disk cache is only an optimization, so failing to write it is fine.
+                try:
+                    os.makedirs(directory, exist_ok=True)
+                    tmp_path = f'{path}.{os.getpid()}.png'
+                    if img.save(tmp_path, 'PNG'):
+                        os.replace(tmp_path, path)
+                except OSError:
+                    pass
+
+            img.setDevicePixelRatio(dpr)
+            self.images[key] = img
+            return img
+
+        def pixmap(self, name: str, custom_colors_dict: dict[str, str] | None = None, size: int = 32, dpr: float = 1.0) -> QPixmap:
+            return QPixmap.fromImage(self.image(name, custom_colors_dict, size, dpr))
+
+        def icon(self, name: str, custom_colors_dict: dict[str, str] | None = None, size: int = 32, dpr: float = 1.0) -> QIcon:
+            return QIcon(self.pixmap(name, custom_colors_dict, size, dpr))
+
+
+type CursorKey = tuple[str | Qt.CursorShape, int, str | None, float, int, int]
+
+
+class CursorCache():
+        """QCursors keyed by (kind, size, colour, device pixel ratio, hotspot x, hotspot y), built once."""
+        def __init__(self):
+            self.cursors: dict[CursorKey, QCursor] = {}
+
+        def get(self, key: CursorKey, build: Callable[[], QCursor]) -> QCursor:
+            cursor = self.cursors.get(key)
+            if cursor is None:
+                cursor = self.cursors[key] = build()
+            return cursor
+
+
+def _resources_xml_path() -> str:
+    try:
+        prefix: str = sys._MEIPASS
+    except:
+        prefix = os.path.dirname(os.path.realpath(__file__))
+    return os.path.join(prefix, 'utils', 'resources.xml')
+
+
+class SharedState():
+        """Configuration, icon and cursor caches and tool settings shared by
+        the windows of one screenpen instance, one window per screen with
+        --all-screens.
+        """
+        def __init__(self, config_file: str | None = None):
+            self.resources_xml: str = _resources_xml_path()
+            with PROFILER.phase('Configuration'):
+                self.config: Configuration = Configuration(config_file)
+            self.icons: IconCache = IconCache(self.resources_xml)
+            self.cursors: CursorCache = CursorCache()
+            self.windows: list[QMainWindow] = []
+            # The window drawn on last, target of undo/redo from other instances.
+            self.active: QMainWindow | None = None
+
+            self.curr_method: str = 'drawPath'
+            self.curr_color: Color = COLORS['red']
+            self.curr_style: Qt.PenStyle = PEN_STYLES['solidLine']
+            self.curr_capstyle: Qt.PenCapStyle = PEN_CAP_STYLES['roundCap']
+            self.curr_joinstyle: Qt.PenJoinStyle = PEN_JOIN_STYLES['roundJoin']
+            self.curr_width: int = int(self.config["default_pen_size"])
+            self.curr_br: QtGui.QBrush = QtGui.QBrush(self.curr_color)
+            self.curr_pen: QtGui.QPen = QtGui.QPen()
+            self.highlighting: bool = False
+            self.highlight_alpha: int = 128
+            # Set by --record-trace.
+            self.trace: TraceRecorder | None = None
+
+
+# Session traces (--record-trace/--replay-trace): a header, then one record per
+# input event reaching a window, see TraceRecorder.
+TRACE_MAGIC = b'SPTRACE\x02'
+# struct formats: record (kind, window, time), mouse (x, y, button, buttons)
+# and length prefix. Mouse buttons go up to Qt.MouseButton.ExtraButton24.
+TRACE_RECORD, TRACE_MOUSE, TRACE_LENGTH = '<BBd', '<hhII', '<H'
+TRACE_PRESS, TRACE_MOVE, TRACE_RELEASE, TRACE_ACTION = 1, 2, 3, 4
+
+
+def _encode_trace_arg(arg):
+    if isinstance(arg, QColor):
+        return {'QColor': arg.name(QColor.NameFormat.HexArgb)}
+    if isinstance(arg, Qt.GlobalColor):
+        return {'QColor': QColor(arg).name(QColor.NameFormat.HexArgb)}
+    if isinstance(arg, Qt.PenStyle):
+        return {'PenStyle': arg.value}
+    if isinstance(arg, (bool, int, float, str)) or arg is None:
+        return arg
+    return None # e.g. callbacks, they cannot be replayed
+
+
+def _decode_trace_arg(arg):
+    if isinstance(arg, dict):
+        if 'QColor' in arg:
+            return QColor(arg['QColor'])
+        if 'PenStyle' in arg:
+            return Qt.PenStyle(arg['PenStyle'])
+    return arg
+
+
+class TraceRecorder():
+        """Appends the input events of a session to a compact binary file.
+
+        Each record is (kind, window index, seconds since the start) followed
+        by x, y, button and buttons for mouse events, or a length-prefixed JSON
+        [method, args, kwargs] for tool changes, shortcuts and other window actions.
+        """
+        def __init__(self, path: str, windows: list[QMainWindow], transparent: bool):
+            import atexit
+            import json
+            import struct
+            self.record: struct.Struct = struct.Struct(TRACE_RECORD)
+            self.mouse: struct.Struct = struct.Struct(TRACE_MOUSE)
+            self.length: struct.Struct = struct.Struct(TRACE_LENGTH)
+            self.windows: list[QMainWindow] = windows
+            self.start: float = time.monotonic()
+            # Actions called by other traced actions are not recorded, replaying the outer one repeats them.
+            self.depth: int = 0
+
+            header = json.dumps({
+                'version': __version__,
+                'transparent': transparent,
+                'screens': [[w.screen_geom.x(), w.screen_geom.y(), w.screen_geom.width(), w.screen_geom.height(), w.canvas_dpr] for w in windows],
+            }).encode()
+            self.fp = open(path, 'wb')
+            _ = self.fp.write(TRACE_MAGIC + self.length.pack(len(header)) + header)
+            atexit.register(self.close)
+
+        def mouseEvent(self, kind: int, window: QMainWindow, event: QMouseEvent):
+            pos = event.pos()
+            _ = self.fp.write(self.record.pack(kind, self.windows.index(window), time.monotonic() - self.start)
+                              + self.mouse.pack(pos.x(), pos.y(), event.button().value, event.buttons().value))
+            if kind == TRACE_RELEASE:
+                self.fp.flush()
+
+        def action(self, window: QMainWindow, name: str, args: tuple, kwargs: dict):
+            import json
+            payload = json.dumps([name, [_encode_trace_arg(arg) for arg in args],
+                                  {key: _encode_trace_arg(arg) for key, arg in kwargs.items()}]).encode()
+            _ = self.fp.write(self.record.pack(TRACE_ACTION, self.windows.index(window), time.monotonic() - self.start)
+                              + self.length.pack(len(payload)) + payload)
+            self.fp.flush()
+
+        def close(self):
+            if not self.fp.closed:
+                self.fp.close()
+
+
+def _run_traced(window, name: str, args: tuple, kwargs: dict, fun: Callable[[], None]):
+    trace = window.shared.trace
+    if trace is None or trace.depth:
+        return fun()
+    trace.action(window, name, args, kwargs)
+    trace.depth += 1
+    try:
+        return fun()
+    finally:
+        trace.depth -= 1
+
+
+def _traced(method):
+    """Records calls of a window method without arguments in the session trace."""
+    @wraps(method)
+    def _call(self):
+        return _run_traced(self, method.__name__, (), {}, lambda: method(self))
+    return _call
+
+
+def _traced_factory(factory):
+    """Like _traced, for methods that return the callback connected to an action or shortcut."""
+    @wraps(factory)
+    def _factory(self, *args, **kwargs):
+        fun = factory(self, *args, **kwargs)
+        def _call():
+            return _run_traced(self, factory.__name__, args, kwargs, fun)
+        return _call
+    return _factory
+
+
+@contextmanager
+def _traced_mouse(window, kind: int, event: QMouseEvent):
+    """Records a mouse press or release; actions run by its handler (e.g.
+    toggle_menus on a middle click) are replayed by the event, not recorded."""
+    trace = window.shared.trace
+    if trace is None:
+        yield
+        return
+    trace.mouseEvent(kind, window, event)
+    trace.depth += 1
+    try:
+        yield
+    finally:
+        trace.depth -= 1
+
+
+def _shared(name: str) -> property:
+    """A window attribute that lives on the window's SharedState."""
+    return property(lambda self: getattr(self.shared, name),
+                    lambda self, value: setattr(self.shared, name, value))
+
+
+class ScreenPenWindow(QMainWindow):
+    # Tool settings are shared by all windows of an instance.
+    curr_method = _shared('curr_method')
+    curr_color = _shared('curr_color')
+    curr_style = _shared('curr_style')
+    curr_capstyle = _shared('curr_capstyle')
+    curr_joinstyle = _shared('curr_joinstyle')
+    curr_width = _shared('curr_width')
+    curr_br = _shared('curr_br')
+    curr_pen = _shared('curr_pen')
+    highlighting = _shared('highlighting')
+    highlight_alpha = _shared('highlight_alpha')
+
+    def __init__(self, screen: QScreen, screen_geom: QRect, pixmap: QtGui.QPixmap | None = None, transparent_background: bool = True,
+                    config_file: str | None = None, show: bool = True, shared: SharedState | None = None,
+                    toolbars: bool = True): # app: QApplication
+        super().__init__()
+
+        self.shared: SharedState = shared if shared is not None else SharedState(config_file)
+        self.shared.windows.append(self)
+        self.resources_xml: str = self.shared.resources_xml
+        self.config: Configuration = self.shared.config
         
 
         
@@ -209,6 +1396,7 @@ class ScreenPenWindow(QMainWindow):
             raise Exception("Error setting initial pixmap")
 
         self.screen_geom: QRect = screen_geom
+        self.canvas_dpr: float = screen.devicePixelRatio()
         self.transparent_background: bool = transparent_background
         self.hidden_menus: bool = bool(self.config["hidden_menus"])
         self.icon_size: int = int(self.config["icon_size"])
@@ -220,37 +1408,56 @@ class ScreenPenWindow(QMainWindow):
             self.setAttribute(WINDOW_ATTRS['translucentBackground'])
         # self.move(screen_geom.topLeft())
         self.setGeometry(screen_geom)
-        self.activateWindow()
-        self.showFullScreen()
-        self._createCanvas()
-        self._clearCanvas()
+        # A resident window hides instead of quitting, see present() and dismiss().
+        self.resident: bool = False
+        if show:
+            self.activateWindow()
+            self.showFullScreen()
+        with PROFILER.phase('canvas allocation'):
+            self._createCanvas()
+            self._clearCanvas()
         
         
-        self.history: DrawingHistory = DrawingHistory(int(self.config["drawing_history"]))
-        self.history.append(self.screen_pixmap)
+        # Allocated when the window is first drawn on, see history.
+        self._history: DrawingHistory | None = None
+        self.recorder: PatchRecorder | None = None
 
         self.begin: QPoint = QPoint()
         self.end: QPoint = QPoint()
         self.lastPoint: QPoint = QPoint()
 
         self.drawing: bool = False
-        self.curr_method: str = 'drawPath'
-        self.curr_color: Color = COLORS['red']
-        self.curr_style: Qt.PenStyle = PEN_STYLES['solidLine']
-        self.curr_capstyle: Qt.PenCapStyle = PEN_CAP_STYLES['roundCap']
-        self.curr_joinstyle: Qt.PenJoinStyle = PEN_JOIN_STYLES['roundJoin']
-        self.curr_width: int = int(self.config["default_pen_size"])
-        self.curr_br: QtGui.QBrush = QtGui.QBrush(self.curr_color)
-        self.curr_pen: QtGui.QPen = QtGui.QPen()
 
         self.curr_args: list[QRect | QPoint | int | QPainterPath | None] = []
         self.path: QPainterPath | None = None
+        self.stroke: StrokeEngine | None = None
+
+        # Frame-paced input: pointer positions are buffered as they arrive and
+        # flushInput() hands them to the current tool as one batch, at most
+        # once per display refresh.
+        self.pending_points: list[QPoint] = []
+        self.frame_interval: float = 1.0 / (screen.refreshRate() or 60.0)
+        self.last_frame: float = 0.0
+        self.input_frames: int = 0
+        self.frame_timer: QtCore.QTimer = QtCore.QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        _ = self.frame_timer.timeout.connect(self.flushInput)
+
+        # Damaged-region tracking. Pixel counters let us check how much is
+        # composited onto the window per frame.
+        self.preview_rect: QRect = QRect()
+        self.composited_pixels: int = 0
+        self.composited_pixels_total: int = 0
 
-        self.highlighting: bool = False
-        self.highlight_alpha: int = 128
         self._setupTools()
-        self._setupIcons()
-        self._createToolBars()
+        with PROFILER.phase('_setupIcons'):
+            self._setupIcons()
+        self.toolBars: list[QToolBar] = []
+        if toolbars:
+            with PROFILER.phase('_createToolBars'):
+                self._createToolBars()
+        self.first_paint_done: bool = False
         if self.hidden_menus:
             self.hide_menus()
 
@@ -274,20 +1481,29 @@ class ScreenPenWindow(QMainWindow):
         _ = self.sc_highlight.activated.connect(self.setHighlight())
 
 
+    def _getCursor(self, kind: str | Qt.CursorShape, size: int = 32, color: str | None = None, hotx: int = 2, hoty: int = 2) -> QCursor:
+        dpr = self.devicePixelRatioF()
+
+        def _build() -> QCursor:
+            if type(kind) == Qt.CursorShape:
+                return QCursor(kind)
+            if kind == 'eraser':
+                return QCursor(self._eraserPixmap(size, dpr), hotx, hoty)
+            return QCursor(self.icons.pixmap(kind, {'STROKE': color} if color is not None else None, size, dpr), hotx, hoty)
+
+        return self.cursors.get((kind, size, color, dpr, hotx, hoty), _build)
+
+
     def _setCursor(self, cursor: str | Qt.CursorShape | QPixmap, hotx: int | None = None, hoty: int | None = None):
         if hotx is None:
             hotx = 2
         if hoty is None:
             hoty = 2
-        if type(cursor) == str:
-            temp = self._applySvgConfig(self._icons[cursor], None)
-            pixm = QPixmap.fromImage(QtGui.QImage.fromData(bytes(temp, encoding='utf-8')))
-            pixm = pixm.scaled(QSize(32, 32))
-            self.setCursor(QCursor(pixm, int(hotx), int(hoty)))
-        elif type(cursor) == Qt.CursorShape:
-            self.setCursor(QCursor(cursor))
-        elif type(cursor) == QPixmap:
-            self.setCursor(QCursor(cursor, int(hotx), int(hoty)))
+        for window in self.shared.windows:
+            if type(cursor) == str or type(cursor) == Qt.CursorShape:
+                window.setCursor(window._getCursor(cursor, 32, None, int(hotx), int(hoty)))
+            elif type(cursor) == QPixmap:
+                window.setCursor(QCursor(cursor, int(hotx), int(hoty)))
 
 
     # @override
@@ -319,64 +1535,35 @@ class ScreenPenWindow(QMainWindow):
 
 
     def _setupIcons(self):
-        self._icons: dict[str, str] = {}
-
-        try:
-            DOMTree = minidom.parse(self.resources_xml)
-            icons = DOMTree.getElementsByTagName('icon')
-
-            if len(icons) < 1:
-                raise Exception('ERROR: there are no icons in resources.xml file')
-
-            for icon in icons:
-                if icon.getAttribute('name')=='':
-                    raise Exception('ERROR: resources.xml: icon doesnt contain "name" attribute')
-
-                self._icons[icon.getAttribute('name')] = icon.getElementsByTagName('svg')[0].toxml().replace('\n', '')
-
-        except FileNotFoundError as ex:
-            print('ERROR: There is no resources.xml file')
-            raise ex
-
-    def _applySvgConfig(self, svg_str: str, custom_colors_dict: dict[str, str] | None = None):
-        colors_dict = {
-            'STROKE': 'white',
-            'FILL': 'silver'
-        }
-        if custom_colors_dict is not None:
-            colors_dict = {**colors_dict, **custom_colors_dict}
-
-        parsed = svg_str
-        for el in colors_dict:                
-            parsed = parsed.replace(f'{{{el}}}', colors_dict[el])
-
-        return parsed
+        self.icons: IconCache = self.shared.icons
+        self.cursors: CursorCache = self.shared.cursors
 
 
     def _getIcon(self, name: str, custom_colors_dict: dict[str, str] | None = None):
-        return QIcon(QtGui.QPixmap.fromImage(QtGui.QImage.fromData(bytes(self._applySvgConfig(self._icons[name], custom_colors_dict), encoding='utf-8'))))
+        return self.icons.icon(name, custom_colors_dict, self.icon_size, self.devicePixelRatioF())
 
 
     def _createCanvas(self):
-        self.background: QImage = QtGui.QImage(self.size(), IMAGE_FORMATS['ARGB32'])
-        self.imageDraw: QImage = QtGui.QImage(self.size(), IMAGE_FORMATS['ARGB32'])
-        self.imageDraw_bck: QImage = QtGui.QImage(self.size(), IMAGE_FORMATS['ARGB32'])
+        # Allocated at the screen's native resolution, see TiledCanvas.
+        self.background: TiledCanvas = TiledCanvas(self.size(), dpr=self.canvas_dpr)
+        self.background_pixmap: QPixmap | None = None
+        self.imageDraw: TiledCanvas = TiledCanvas(self.size(), dpr=self.canvas_dpr)
+        self._updateTransforms()
         self._clearBackground()
     
 
+    @_traced
     def _clearBackground(self): # make background transparent
+        self.background.fill(COLORS['transparent'])
         if self.transparent_background:
-            self.background.fill(COLORS['transparent'])
+            self.background_pixmap = None
         else:
-            qp2 = QtGui.QPainter(self.background)
-            qp2.drawPixmap(self.background.rect(), self.screen_pixmap, self.screen_pixmap.rect())
-            _ = qp2.end()
+            self.background_pixmap = self.screen_pixmap
         self.update()
 
 
     def _clearCanvas(self):
         self.imageDraw.fill(COLORS['transparent'])
-        self.imageDraw_bck.fill(COLORS['transparent'])
         self.update()
 
 
@@ -389,6 +1576,7 @@ class ScreenPenWindow(QMainWindow):
         self.curr_pen.setWidth(self.curr_width)
 
 
+    @_traced_factory
     def setColor(self, color: Color):
         def _setColor():
             self.curr_color = color
@@ -405,6 +1593,7 @@ class ScreenPenWindow(QMainWindow):
         return _setColor
 
 
+    @_traced_factory
     def setHighlight(self):
         def _setHighlight():
             if not self.highlighting:
@@ -439,37 +1628,45 @@ class ScreenPenWindow(QMainWindow):
         return pen
 
 
-    def setEraser(self):
-        def _setEraser():
-            pix = QPixmap()
-            img = QtGui.QImage(QSize(32, 32), IMAGE_FORMATS['ARGB32'])
-            img.fill(COLORS['transparent'])
+    def _eraserPixmap(self, size: int = 32, dpr: float = 1.0) -> QPixmap:
+        pixels = max(1, round(size * dpr))
+        img = QtGui.QImage(QSize(pixels, pixels), IMAGE_FORMATS['ARGB32'])
+        img.fill(COLORS['transparent'])
 
-            qp = QtGui.QPainter(img)
-            qp.setPen(self._getEraserPen(QColor('#7acfe6'), 30))
-            path = QtGui.QPainterPath()
+        qp = QtGui.QPainter(img)
+        qp.scale(pixels / 32, pixels / 32)
+        qp.setPen(self._getEraserPen(QColor('#7acfe6'), 30))
+        path = QtGui.QPainterPath()
 
-            _path_move_to(path, QPoint(16, 16))
-            _path_cubic_to(path, QPoint(16, 17), QPoint(16, 16), QPoint(16, 16))
+        _path_move_to(path, QPoint(16, 16))
+        _path_cubic_to(path, QPoint(16, 17), QPoint(16, 16), QPoint(16, 16))
 
-            qp.drawPath(path)
-            qp.setPen(self._getEraserPen(QColor('#eccdec'), 26))
+        qp.drawPath(path)
+        qp.setPen(self._getEraserPen(QColor('#eccdec'), 26))
 
-            path = QtGui.QPainterPath()
+        path = QtGui.QPainterPath()
 
-            _path_move_to(path, QPoint(16, 16))
-            _path_cubic_to(path, QPoint(16, 17), QPoint(16, 16), QPoint(16, 16))
+        _path_move_to(path, QPoint(16, 16))
+        _path_cubic_to(path, QPoint(16, 17), QPoint(16, 16), QPoint(16, 16))
 
-            qp.drawPath(path)
-            _ = qp.end()
+        qp.drawPath(path)
+        _ = qp.end()
 
-            pix = pix.fromImage(img)
+        img.setDevicePixelRatio(dpr)
+        return QPixmap.fromImage(img)
+
+
+    @_traced_factory
+    def setEraser(self):
+        def _setEraser():
             self.setAction('drawEraser')()
-            self._setCursor(pix, 16, 16)
+            for window in self.shared.windows:
+                window.setCursor(window._getCursor('eraser', 32, None, 16, 16))
             self._setupTools()
         return _setEraser
 
 
+    @_traced_factory
     def setPenStyle(self, style: Qt.PenStyle):
         def _setStyle():
             self.curr_style = style
@@ -478,6 +1675,7 @@ class ScreenPenWindow(QMainWindow):
         return _setStyle
 
 
+    @_traced_factory
     def setWidth(self, width: int):
         def _setWidth():
             self.curr_width = width
@@ -485,6 +1683,7 @@ class ScreenPenWindow(QMainWindow):
         return _setWidth
     
 
+    @_traced_factory
     def increaseWidth(self):
         def _increaseWidth():
             self.curr_width += 2
@@ -492,6 +1691,7 @@ class ScreenPenWindow(QMainWindow):
         return _increaseWidth
     
 
+    @_traced_factory
     def decreaseWidth(self):
         def _decreaseWidth():
             self.curr_width -= 2
@@ -502,6 +1702,7 @@ class ScreenPenWindow(QMainWindow):
         return _decreaseWidth
 
 
+    @_traced_factory
     def setAction(self, action: str, cursor: str | Qt.CursorShape | QPixmap | None = None):
         def _setAction():
             self.curr_method = action
@@ -588,34 +1789,59 @@ class ScreenPenWindow(QMainWindow):
         
 #         return _showChart
 
+    @_traced_factory
     def removeDrawing(self):
         def _removeDrawing():
+            if self._history is None:
+                return # never drawn on
+            recorder = PatchRecorder(self.imageDraw)
+            recorder.touch(self.imageDraw.rect())
             self._clearCanvas()
+            cmd = DrawCommand('clear', QPolygon())
+            cmd.patch = recorder.commit()
+            self.history.append(cmd)
         return _removeDrawing
 
 
     def captureScreen(self):
-        for tb in self.toolBars:
-            tb.hide()
-
-        img = self.imageDraw.copy()
+        # Layers are composited directly, so the toolbars are never part of the image.
+        # At the canvas' native resolution.
+        img = QtGui.QImage(self.imageDraw._toDevice(self.imageDraw.rect()).size(), IMAGE_FORMATS['ARGB32'])
+        img.setDevicePixelRatio(self.canvas_dpr)
+        img.fill(COLORS['transparent'])
+        rect = self.imageDraw.rect()
         qp = QtGui.QPainter(img)
-        qp.drawPixmap(img.rect(), self.screen_pixmap, self.screen_pixmap.rect())
-        qp.drawImage(img.rect(), self.background, self.background.rect())
-        qp.drawImage(img.rect(), self.imageDraw, self.imageDraw.rect())
+        qp.drawPixmap(QRectF(rect), self.screen_pixmap, QRectF(self.screen_pixmap.rect()))
+        self.background.render(qp, rect)
+        self.imageDraw.render(qp, rect)
         _ = qp.end()
 
-        for tb in self.toolBars:
-            tb.show()
-
         return img
 
+    def _onDrawingSaved(self, path: str, ok: bool):
+        if ok:
+            print(f'Saved {path}')
+        else:
+            print(f'Error: Could not save {path}')
+
     # TODO use pyscreenshot https://github.com/ponty/pyscreenshot to save drawing.
-    def saveDrawing(self):
+    @_traced_factory
+    def saveDrawing(self, callback: Callable[[str, bool], None] | None = None):
         def _saveDrawing(_: int = 0):
-            filename = f'{datetime.now().strftime("%Y%m%d_%H%M%S")}.png'
+            from datetime import datetime
+            fmt, ext = SAVE_FORMATS[str(self.config["save_format"]).lower()]
+            directory = os.path.expanduser(str(self.config["save_directory"]))
+            name = datetime.now().strftime("%Y%m%d_%H%M%S")
+            if len(self.shared.windows) > 1:
+                # With --all-screens every overlay saves in the same second.
+                name += f'_{self.shared.windows.index(self) + 1}'
+            filename = os.path.join(directory, f'{name}.{ext}')
             print(f'Saving {filename}')
-            _ = self.captureScreen().save(f'{filename}')
+
+            # Only the composite happens here; encoding and writing run on the pool.
+            worker = SaveWorker(self.captureScreen(), filename, fmt, int(self.config["save_compression"]))
+            _ = worker.signals.finished.connect(callback if callback is not None else self._onDrawingSaved)
+            QThreadPool.globalInstance().start(worker)
         return _saveDrawing
 
 
@@ -624,9 +1850,7 @@ class ScreenPenWindow(QMainWindow):
             color = QColorDialog.getColor()
 
             if color.isValid():
-                self.curr_color = color
-                if self.highlighting:
-                    self.curr_color.setAlpha(self.highlight_alpha)
+                self.setColor(color)()
         return _colorPicker
 
 
@@ -717,12 +1941,79 @@ class ScreenPenWindow(QMainWindow):
         actionBar.addAction(self.addNewAction("Save image", self._getIcon('save'), self.saveDrawing())) # self.style().standardIcon(QtWidgets.QStyle.SP_DialogSaveButton)
 
         
-    def scaleCoords(self, coords: QPoint):
+    def _updateTransforms(self):
+        """Precomputes the window <-> canvas mappings; both are the identity
+        unless the window was resized after the canvas was allocated."""
         canvas_size = self.imageDraw.size()
         window_size = self.size()
-        x_scale = canvas_size.width() / window_size.width()
-        y_scale = canvas_size.height() / window_size.height()
-        return QtCore.QPoint(int(coords.x()*x_scale), int(coords.y()*y_scale))
+        self.input_transform: QTransform = QTransform.fromScale(canvas_size.width() / window_size.width(),
+                                                                canvas_size.height() / window_size.height())
+        self.paint_transform: QTransform = self.input_transform.inverted()[0]
+
+
+    @override
+    def resizeEvent(self, a0: QResizeEvent | None):
+        super().resizeEvent(a0)
+        if hasattr(self, 'imageDraw'): # the canvas is created after the window is shown
+            self._updateTransforms()
+
+
+    def scaleCoords(self, coords: QPoint):
+        if self.input_transform.isIdentity():
+            return QPoint(coords)
+        return self.input_transform.map(QPointF(coords)).toPoint()
+
+
+    def _windowToCanvasRect(self, rect: QRect) -> QRect:
+        if self.input_transform.isIdentity():
+            return QRect(rect)
+        return self.input_transform.mapRect(QRectF(rect)).toAlignedRect()
+
+
+    def _canvasToWindowRect(self, rect: QRect) -> QRect:
+        if self.paint_transform.isIdentity():
+            return QRect(rect)
+        return self.paint_transform.mapRect(QRectF(rect)).toAlignedRect()
+
+
+    def _strokeMargin(self) -> int:
+        width = 30 if self.curr_method == 'drawEraser' else self.curr_width
+        return width // 2 + 2
+
+
+    def _shapeBounds(self) -> QRect:
+        """Canvas rect touched by the rect/line/dot being dragged to `self.end`."""
+        m = self._strokeMargin()
+        if self.curr_method == 'drawDot':
+            return QRect(self.end.x() - 10, self.end.y() - 10, 21, 21).adjusted(-m, -m, m, m)
+        return QRect(self.begin, self.end).normalized().adjusted(-m, -m, m, m)
+
+
+    def _updateDamaged(self):
+        bounds = self._shapeBounds()
+        damaged = bounds
+        if self.curr_method in ['drawRect', 'drawLine', 'drawDot']:
+            # The previous preview has to be repainted too, so it gets erased.
+            damaged = bounds.united(self.preview_rect)
+            self.preview_rect = bounds
+        self.update(self._canvasToWindowRect(damaged))
+
+    def _drawShape(self, qp: QPainter):
+        """Draws the rect/line/dot being dragged with the current pen."""
+        qp.setPen(self.curr_pen)
+        if self.curr_method == 'drawDot':
+            qp.setBrush(self.curr_br)
+            self.curr_args = [self.end, 10, 10]
+            qp.drawEllipse(*self.curr_args)
+            return
+
+        qp.setBrush(BRUSHES['no_brush'])
+        if self.curr_method == 'drawRect':
+            self.curr_args = [QRect(self.begin, self.end)]
+        else:
+            self.curr_args = [self.begin, self.end]
+        getattr(qp, self.curr_method)(*self.curr_args)
+        qp.setBrush(self.curr_br)
 
     @override
     def paintEvent(self, a0: QPaintEvent | None):
@@ -731,69 +2022,67 @@ class ScreenPenWindow(QMainWindow):
         else:
             raise Exception("Invalid painting event")
 
+        paint_start = time.monotonic()
         self._setupTools()
 
-        qp = QtGui.QPainter(self.imageDraw)
         canvasPainter = QtGui.QPainter(self)
-
-
-
-        qp.setCompositionMode(COMPOSITION_MODE['source'])
         canvasPainter.setCompositionMode(COMPOSITION_MODE['source_over'])
 
-        if BUTTONS['left'] and self.drawing:
-            qp.setPen(self.curr_pen)
-            qp.setBrush(self.curr_br)
-            if self.curr_method in ['drawRect']:
-                qp.setBrush(BRUSHES['no_brush'])
-                self.curr_args = [QRect(self.begin, self.end)]
-                qp.drawImage(self.imageDraw.rect(), self.imageDraw_bck, self.imageDraw_bck.rect())
-                
-                getattr(qp, self.curr_method)(*self.curr_args)
-                qp.setBrush(self.curr_br)
-            elif self.curr_method in ['drawDot']:
-                self.curr_args = [self.end, 10, 10]
-                qp.drawImage(self.imageDraw.rect(), self.imageDraw_bck, self.imageDraw_bck.rect())
-                
-                getattr(qp, 'drawEllipse')(*self.curr_args)
+        # Composite only the damaged part of the window.
+        target = event.rect()
+        source = self._windowToCanvasRect(target)
+        if not self.paint_transform.isIdentity():
+            canvasPainter.setTransform(self.paint_transform, True)
+        if self.background_pixmap is not None:
+            # Painted in screenshot pixels, so a native resolution screenshot
+            # is copied 1:1 like the canvas tiles.
+            pixmap = self.background_pixmap
+            to_pixmap = QTransform.fromScale(pixmap.width() / self.imageDraw.width(), pixmap.height() / self.imageDraw.height())
+            pixmap_source = to_pixmap.mapRect(QRectF(source)).toAlignedRect()
+            canvasPainter.save()
+            canvasPainter.setTransform(to_pixmap.inverted()[0], True)
+            canvasPainter.drawPixmap(pixmap_source, pixmap, pixmap_source)
+            canvasPainter.restore()
+        self.background.render(canvasPainter, source)
+
+        # An opaque shape being dragged looks the same drawn straight over the
+        # composited canvas. A translucent one is drawn onto a copy of the
+        # canvas under it, with the same composition as when it is flattened
+        # into imageDraw on mouse release, so the preview matches the result
+        # (e.g. a highlighter replaces what is under it rather than blending
+        # with it).
+        preview_rect = QRect()
+        if self.drawing and self.curr_method in ['drawRect', 'drawLine', 'drawDot']:
+            preview_rect = source.intersected(self.preview_rect)
+        if preview_rect.isEmpty():
+            self.imageDraw.render(canvasPainter, source)
+        elif self.curr_pen.color().alpha() == 255:
+            self.imageDraw.render(canvasPainter, source)
+            canvasPainter.setClipRect(source)
+            self._drawShape(canvasPainter)
+        else:
+            preview = self.imageDraw.copy(preview_rect)
+            qp = QPainter(preview)
+            qp.setCompositionMode(COMPOSITION_MODE['source'])
+            qp.translate(-preview_rect.x(), -preview_rect.y())
+            self._drawShape(qp)
+            _ = qp.end()
+            canvasPainter.save()
+            canvasPainter.setClipRegion(QRegion(source).subtracted(QRegion(preview_rect)))
+            self.imageDraw.render(canvasPainter, source)
+            canvasPainter.restore()
+            canvasPainter.drawImage(preview_rect.topLeft(), preview)
+        _ = canvasPainter.end()
 
-            elif self.curr_method in ['drawLine']:
-                qp.setBrush(BRUSHES['no_brush'])
-                self.curr_args = [self.begin, self.end]
-                qp.drawImage(self.imageDraw.rect(), self.imageDraw_bck, self.imageDraw_bck.rect())
-                
-                getattr(qp, self.curr_method)(*self.curr_args)
-                qp.setBrush(self.curr_br)
+        self.composited_pixels = target.width() * target.height()
+        self.composited_pixels_total += self.composited_pixels
 
-            elif self.curr_method in ['drawPath']:
-                if self.lastPoint != self.end:
-                    qp.setBrush(BRUSHES['no_brush'])
-                    qp.setPen(self.curr_pen)
-                    _path_cubic_to(self.path, self.end, self.end, self.end)
-                    self.curr_args = [self.path]
-                    getattr(qp, self.curr_method)(*self.curr_args)
-                    self.lastPoint = self.end
-                    self.update()
-                    qp.setBrush(self.curr_br)
-
-            elif self.curr_method in ['drawEraser']:
-                if self.lastPoint != self.end:
-                    qp.setBrush(BRUSHES['no_brush'])
-                    qp.setPen(self._getEraserPen(COLORS['transparent']))
-                    _path_cubic_to(self.path, self.end, self.end, self.end)
-                    self.curr_args = [self.path]
-                    getattr(qp, 'drawPath')(*self.curr_args)
-                    self.lastPoint = self.end
-                    self.update()
-                    qp.setBrush(self.curr_br)
-
-        qp.setCompositionMode(COMPOSITION_MODE['source_over'])
-        _ = qp.end()
-        
-        canvasPainter.drawImage(self.rect(), self.background, self.background.rect())
-        canvasPainter.drawImage(self.rect(), self.imageDraw, self.imageDraw.rect())
-        canvasPainter.setCompositionMode(COMPOSITION_MODE['source_over'])
-        _ = canvasPainter.end()
+        if not self.first_paint_done:
+            self.first_paint_done = True
+            PROFILER.record('first paintEvent', paint_start, time.monotonic())
+            if PROFILER.enabled:
+                # A profiling run only measures startup.
+                QtCore.QTimer.singleShot(0, QApplication.quit)
 
     
     @override
@@ -802,31 +2091,34 @@ class ScreenPenWindow(QMainWindow):
             event = a0
         else:
             raise Exception("Invalid mouse event")
-        
-        # TODO make the buttons use config values
-        if event.button() == BUTTONS['right']:
-            sys.exit(0)
-
-        if event.button() == BUTTONS['middle']:
-            self.toggle_menus()
+        with _traced_mouse(self, TRACE_PRESS, event):
+            # TODO make the buttons use config values
+            if event.button() == BUTTONS['right']:
+                self.quit_program()
+                return
+
+            if event.button() == BUTTONS['middle']:
+                self.toggle_menus()
             
-        if event.button() == BUTTONS['left'] and self.childAt(event.pos()) is None:
-            self.drawing = True
-
-        if self.curr_method in ['drawRect', 'drawChart', 'drawLine', 'drawDot']:
-            qp = QtGui.QPainter(self.imageDraw_bck)
-            qp.drawImage(self.imageDraw_bck.rect(), self.imageDraw, self.imageDraw.rect())
-            _ = qp.end()
-            self.begin = self.scaleCoords(event.pos())
-            self.end = self.scaleCoords(event.pos())
+            if event.button() == BUTTONS['left'] and self.childAt(event.pos()) is None:
+                self.drawing = True
+                self.recorder = PatchRecorder(self.imageDraw)
+                self.shared.active = self
+
+            self.frame_timer.stop()
+            self.pending_points = []
+            if self.curr_method in ['drawRect', 'drawChart', 'drawLine', 'drawDot']:
+                self.begin = self.scaleCoords(event.pos())
+                self.end = self.scaleCoords(event.pos())
+                self.preview_rect = self._shapeBounds()
             
-        elif self.curr_method in ['drawPath', 'drawEraser']:
-            self.path = QPainterPath()
-            self.begin = self.scaleCoords(event.pos())
-            self.end = self.scaleCoords(event.pos())
-            _path_move_to(self.path, self.begin)
-            self.lastPoint = self.scaleCoords(event.pos())
-        self.update()
+            elif self.curr_method in ['drawPath', 'drawEraser']:
+                self.begin = self.scaleCoords(event.pos())
+                self.end = self.scaleCoords(event.pos())
+                self.stroke = StrokeEngine(self.begin)
+                self.path = self.stroke.path
+                self.lastPoint = self.scaleCoords(event.pos())
+            self.update()
 
     @override
     def mouseMoveEvent(self, a0: QMouseEvent | None):
@@ -834,30 +2126,134 @@ class ScreenPenWindow(QMainWindow):
             event = a0
         else:
             raise Exception("Invalid mouse event")
-            
-        self.end = self.scaleCoords(event.pos())
+        if self.shared.trace is not None:
+            self.shared.trace.mouseEvent(TRACE_MOVE, self, event)
+
+        if not self.drawing:
+            return
+        # Every point of the event is kept; drawing only the newest position
+        # per frame would cut corners off fast strokes.
+        points = event.points()
+        if points:
+            self.pending_points.extend(self.scaleCoords(point.position().toPoint()) for point in points)
+        else:
+            self.pending_points.append(self.scaleCoords(event.pos()))
+        if not self.frame_timer.isActive():
+            delay = self.frame_interval - (time.monotonic() - self.last_frame)
+            self.frame_timer.start(max(0, int(1000 * delay)))
+
+    def flushInput(self):
+        """Feeds the pointer positions buffered since the last frame to the current tool."""
+        self.frame_timer.stop()
+        points, self.pending_points = self.pending_points, []
+        if not points or not self.drawing:
+            return
+        self.last_frame = time.monotonic()
+        self.input_frames += 1
+        self.end = points[-1]
+        if self.curr_method in ['drawPath', 'drawEraser'] and self.stroke is not None:
+            self._addStrokePoints(points)
+        else:
+            self._updateDamaged()
+
+    def _addStrokePoints(self, points: list[QPoint]):
+        """Rasterizes a batch of freehand points onto the canvas and repaints the area they cover."""
+        m = self._strokeMargin()
+        bounds = QPolygon([self.lastPoint, *points]).boundingRect().adjusted(-m, -m, m, m)
+        if self.curr_method == 'drawEraser':
+            pen = self._getEraserPen(COLORS['transparent'])
+        else:
+            pen = self.curr_pen
+        segment = self.stroke.add_points(pen, points) if self.stroke is not None else None
+        if segment is not None:
+            if self.recorder is not None:
+                self.recorder.touch(bounds)
+            path, pen = segment
+            def _drawSegment(qp: QPainter):
+                qp.setBrush(BRUSHES['no_brush'])
+                qp.setPen(pen)
+                qp.drawPath(path)
+            self.imageDraw.paint(bounds, _drawSegment)
+            self.update(self._canvasToWindowRect(bounds))
+        self.curr_args = [self.path]
+        self.lastPoint = points[-1]
+
+    def drawPatch(self, rect: QRect, tiles: Tiles):
+        self.imageDraw.restore(tiles)
+        self.update(self._canvasToWindowRect(rect))
+
+    def _renderCommand(self, cmd: DrawCommand):
+        if cmd.tool == 'clear':
+            self.imageDraw.fill(COLORS['transparent'])
+        elif cmd.breaks is not None and cmd.path is None:
+            # The segments the live stroke was drawn in, for the same pixels.
+            for bounds, draw in cmd.segments():
+                self.imageDraw.paint(bounds, draw, cmd.composition)
+        else:
+            self.imageDraw.paint(cmd.bounds(), cmd.render, cmd.composition, once=cmd.tool in ['drawPath', 'drawEraser'])
+
+    def _rebuildCanvas(self):
+        index, checkpoint = self.history.checkpointBefore(self.history.current)
+        self.imageDraw.fill(COLORS['transparent'])
+        if checkpoint is not None:
+            self.imageDraw.restore(checkpoint.after)
+        for cmd in self.history.applied()[index + 1:]:
+            self._renderCommand(cmd)
         self.update()
 
-    def drawPixmap(self, p: QPixmap):
-        qp =  QPainter(self.imageDraw)
-        qp.setCompositionMode(COMPOSITION_MODE['source'])
-        qp.drawPixmap(self.imageDraw.rect(), p, p.rect())
+    def renderDrawing(self, size: QSize) -> QImage:
+        """Renders the command log into a new image of the given size.
+
+        Commands the history has dropped are drawn from its oldest checkpoint,
+        which is scaled rather than re-rendered.
+        """
+        img = QtGui.QImage(size, IMAGE_FORMATS['ARGB32'])
+        img.fill(COLORS['transparent'])
+        qp = QPainter(img)
+        qp.scale(size.width() / self.imageDraw.width(), size.height() / self.imageDraw.height())
+        _, checkpoint = self.history.checkpointBefore(-1)
+        if checkpoint is not None:
+            base = TiledCanvas(self.imageDraw.size(), dpr=self.imageDraw.dpr)
+            base.restore(checkpoint.after)
+            base.render(qp, base.rect())
+        for cmd in self.history.applied():
+            cmd.render(qp)
         _ = qp.end()
+        return img
 
-        qp2 = QtGui.QPainter(self.imageDraw_bck)
-        qp2.setCompositionMode (COMPOSITION_MODE['source'])
-        qp2.drawPixmap(self.imageDraw_bck.rect(), p, p.rect())
-        _ = qp2.end()
+    @property
+    def history(self) -> DrawingHistory:
+        if self._history is None:
+            self._history = DrawingHistory(int(self.config["drawing_history"]),
+                                           int(self.config["history_memory_mb"]) * 2**20,
+                                           float(self.config["stroke_tolerance"]),
+                                           self.imageDraw)
+        return self._history
 
+    @_traced
     def undo(self):
-        p = self.history.undo()
-        self.drawPixmap(p)
-        self.update()
+        if self._history is None:
+            return
+        cmd = self.history.undo()
+        if cmd is None:
+            return
+        if cmd.patch is not None:
+            self.drawPatch(cmd.patch.rect, cmd.patch.before)
+        else:
+            self._rebuildCanvas()
 
+    @_traced
     def redo(self):
-        p = self.history.redo()
-        self.drawPixmap(p)
-        self.update()
+        if self._history is None:
+            return
+        cmd = self.history.redo()
+        if cmd is None:
+            return
+        if cmd.patch is not None:
+            self.drawPatch(cmd.patch.rect, cmd.patch.after)
+        else:
+            self._renderCommand(cmd)
+            self.update()
 
     def hide_menus(self):
         for toolbar in self.toolBars:
@@ -867,15 +2263,59 @@ class ScreenPenWindow(QMainWindow):
         for toolbar in self.toolBars:
             toolbar.show()
 
+    @_traced
     def toggle_menus(self):
-        if self.hidden_menus:
-            self.show_menus()
-        else:
-            self.hide_menus()
-        self.hidden_menus = not self.hidden_menus
+        for window in self.shared.windows:
+            if window.hidden_menus:
+                window.show_menus()
+            else:
+                window.hide_menus()
+            window.hidden_menus = not window.hidden_menus
 
+    @_traced
     def quit_program(self):
-        sys.exit(0)
+        if self.resident:
+            for window in self.shared.windows:
+                window.dismiss()
+        else:
+            sys.exit(0)
+
+    def present(self, pixmap: QPixmap | None = None):
+        """Shows the window with a fresh canvas, optionally over a new screenshot."""
+        if pixmap is not None:
+            self.screen_pixmap = pixmap
+        self.drawing = False
+        self.stroke = None
+        self.recorder = None
+        self.pending_points = []
+        self._clearBackground()
+        self._clearCanvas()
+        self._history = None
+        self.showFullScreen()
+        self.raise_()
+        self.activateWindow()
+
+    def dismiss(self):
+        self.drawing = False
+        self.hide()
+
+    def _makeCommand(self) -> DrawCommand | None:
+        match self.curr_method:
+            case 'drawPath':
+                if self.stroke is None:
+                    return None
+                return DrawCommand('drawPath', self.stroke.points, self.curr_pen, breaks=self.stroke.breaks)
+            case 'drawEraser':
+                if self.stroke is None:
+                    return None
+                return DrawCommand('drawEraser', self.stroke.points, self._getEraserPen(COLORS['transparent']),
+                                   breaks=self.stroke.breaks)
+            case 'drawRect' | 'drawLine':
+                return DrawCommand(self.curr_method, QPolygon([self.begin, self.end]), self.curr_pen)
+            case 'drawDot':
+                return DrawCommand('drawDot', QPolygon([self.end]), self.curr_pen, self.curr_br)
+            case _:
+                return None
 
     @override
     def mouseReleaseEvent(self, a0: QMouseEvent | None):
@@ -883,67 +2323,113 @@ class ScreenPenWindow(QMainWindow):
             event = a0
         else:
             raise Exception("Invalid mouse event")
-
-        if event.button() == BUTTONS['left'] and self.drawing == True:
-            self.drawing = False
-            self.path = None
-
-            self.begin = self.scaleCoords(event.pos())
-            self.end = self.scaleCoords(event.pos())
-
-            self.update()
-            p = QPixmap()
-            _ = p.convertFromImage(self.imageDraw)
-            self.history.append(el=p)
-
-
+        with _traced_mouse(self, TRACE_RELEASE, event):
+            if event.button() == BUTTONS['left'] and self.drawing == True:
+                self.flushInput()
+                self.drawing = False
+                self.end = self.scaleCoords(event.pos())
+                cmd = self._makeCommand()
+                self.path = None
+                self.stroke = None
+
+                if self.curr_method in ['drawRect', 'drawLine', 'drawDot']:
+                    bounds = self._shapeBounds()
+                    if self.recorder is not None:
+                        self.recorder.touch(bounds)
+                    self.imageDraw.paint(bounds, self._drawShape, once=False)
+                    # Only the flattened shape and the last preview need repainting;
+                    # freehand strokes are already on the canvas.
+                    self.update(self._canvasToWindowRect(bounds.united(self.preview_rect)))
+
+                self.begin = self.scaleCoords(event.pos())
+
+                if self.recorder is not None:
+                    patch = self.recorder.commit()
+                    if cmd is not None and patch is not None:
+                        cmd.patch = patch
+                        self.history.append(el=cmd)
+                    self.recorder = None
+
+
+    @_traced_factory
     def setupBoard(self, color: Color):
         def _setupBoard():
             self.background.fill(color)
+            self.background_pixmap = None
             self.update()
         return _setupBoard
 
 class ScreenshotError(Exception):
     pass
 
-def _get_screenshots_grim(screens: list[QScreen]) -> list[tuple[QScreen, QRect, QPixmap]]:
-    screenshots: list[tuple[QScreen, QRect, QPixmap]] = []
-    for idx, screen in enumerate(screens):
-        screen_geom = QGuiApplication.screens()[idx].geometry()
-        x = screen_geom.x()
-        y = screen_geom.y()
-        w = screen_geom.width()
-        h = screen_geom.height()
-        
-        path = f'./~screen{idx}.png'
+# Per-screen capture time in seconds of the last capture, by backend.
+CAPTURE_TIMINGS: dict[str, list[float]] = {}
 
-        try:
-            _ = subprocess.run(
-                f'grim -g "{x},{y} {w}x{h}" \'{path}\'', 
-                check=True,
-                shell=True,
-                stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
-            )
-            
-            pixmap = QPixmap(f'{path}')
-            screenshots.append((
-                screen,
-                screen_geom,
-                pixmap
-            ))
-
-        except subprocess.CalledProcessError as err:
-            raise ScreenshotError(f'Err: Grim is not available {err}')
-            
-#    for idx in range(len(screens)): # might not be needed.
-        try:
-            os.remove(f'{path}')
-            
-        except FileNotFoundError:
-            temp = os.path.abspath(f'{path}')
-            print(f"Could not delete file: {temp}.")
 
-    return screenshots
+def _capture_concurrently[T](backend: str, screens: list[QScreen], grab: Callable[[int, QRect, QSize], T]) -> list[tuple[QRect, T]]:
+    """Runs `grab(idx, screen_geom, screen_size)` for every screen on a thread pool.
+
+    Results are returned in screen order. Qt screen queries happen here, on
+    the calling thread; `grab` must not touch QScreen or QPixmap.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    geoms = [QGuiApplication.screens()[idx].geometry() for idx in range(len(screens))]
+    sizes = [screen.size() for screen in screens]
+
+    def _timed(idx: int) -> tuple[T, float]:
+        start = time.monotonic()
+        result = grab(idx, geoms[idx], sizes[idx])
+        end = time.monotonic()
+        PROFILER.record(f'_get_screens[{backend}] screen {idx}', start, end)
+        return result, end - start
+
+    with ThreadPoolExecutor(max_workers=len(screens), thread_name_prefix='screenpen-capture') as executor:
+        futures = [executor.submit(_timed, idx) for idx in range(len(screens))]
+        results = [future.result() for future in futures]
+
+    CAPTURE_TIMINGS[backend] = [elapsed for _, elapsed in results]
+    print(f'INFO: {backend} capture: ' + ', '.join(
+        f'screen {idx} {elapsed * 1000:.0f} ms' for idx, (_, elapsed) in enumerate(results)
+    ))
+    return [(geom, result) for geom, (result, _) in zip(geoms, results)]
+
+
+PPM_HEADER = re.compile(rb'P6\s+(\d+)\s+(\d+)\s+(\d+)\s')
+
+
+def _grab_grim(_idx: int, screen_geom: QRect, _size: QSize) -> QImage:
+    import subprocess
+    x = screen_geom.x()
+    y = screen_geom.y()
+    w = screen_geom.width()
+    h = screen_geom.height()
+
+    # Uncompressed PPM on stdout: no temp file and no PNG encode/decode.
+    try:
+        out = subprocess.run(
+            ['grim', '-t', 'ppm', '-g', f'{x},{y} {w}x{h}', '-'],
+            check=True,
+            stderr=subprocess.DEVNULL, stdout=subprocess.PIPE,
+        ).stdout
+
+    except (subprocess.CalledProcessError, OSError) as err:
+        raise ScreenshotError(f'Err: Grim is not available {err}')
+
+    header = PPM_HEADER.match(out)
+    if header is None or int(header.group(3)) != 255:
+        raise ScreenshotError('Err: Grim returned an unsupported image')
+
+    width, height = int(header.group(1)), int(header.group(2))
+    # The QImage keeps a reference to the buffer, so it stays valid as long as the image.
+    return QImage(memoryview(out)[header.end():], width, height, 3 * width, QImage.Format.Format_RGB888)
+
+
+def _get_screenshots_grim(screens: list[QScreen]) -> list[tuple[QScreen, QRect, QPixmap]]:
+    captures = _capture_concurrently('grim', screens, _grab_grim)
+    return [
+        (screen, screen_geom, QPixmap.fromImage(img))
+        for screen, (screen_geom, img) in zip(screens, captures)
+    ]
 
 
 def _grab_screen(screen_idx: int, screen: QScreen):
@@ -969,60 +2455,70 @@ def _grab_screen(screen_idx: int, screen: QScreen):
     
 
 def _get_screenshots_pyqt(screens: list[QScreen]) -> list[tuple[QScreen, QRect, QPixmap]]:
+    # grabWindow has to run on the GUI thread, so this backend stays sequential.
     screenshots: list[tuple[QScreen, QRect, QPixmap]] = []
+    timings: list[float] = []
     for screen_idx, screen in enumerate(screens):
+        start = time.monotonic()
         screen_geom, screen_pixmap = _grab_screen(screen_idx, screen)
+        end = time.monotonic()
+        PROFILER.record(f'_get_screens[pyqt] screen {screen_idx}', start, end)
+        timings.append(end - start)
         screenshots.append((screen, screen_geom, screen_pixmap))
+    CAPTURE_TIMINGS['pyqt'] = timings
     return screenshots
 
 
-def _get_screenshots_pillow(screens: list[QScreen]) -> list[tuple[QScreen, QRect, QPixmap]]:
-    from PIL import ImageGrab, Image, UnidentifiedImageError
-    #from time import sleep
-    screenshots: list[tuple[QScreen, QRect, QPixmap]] = []
-    for idx, screen in enumerate(screens):
-        screen_geom = QGuiApplication.screens()[idx].geometry()
+# Pillow mode: (raw mode, QImage format). Pillow keeps RGB images 4 bytes per
+# pixel, so they are read out as RGBX, which needs no repacking on either side.
+PILLOW_FORMATS = {
+    'RGB': ('RGBX', QImage.Format.Format_RGBX8888),
+    'RGBX': ('RGBX', QImage.Format.Format_RGBX8888),
+    'RGBA': ('RGBA', QImage.Format.Format_RGBA8888),
+}
 
-        try:
-            img = ImageGrab.grab(
-                bbox=(
-                    screen_geom.x(), screen_geom.y(), 
-                    screen_geom.x()+screen.size().width(), screen_geom.y()+screen.size().height()
-                ), 
-                xdisplay=""
-            )
-        
-        except UnidentifiedImageError as err:
-            raise ScreenshotError(f'Pillow problem: {err}')
-            #sleep(1)
-            #try:
-            #    img = [el for el in e.args[0].split("'") if el.endswith('.png')]#[0]
-            #    img = Image.open(img)
-            #    img = img.crop((screen_geom.x(), screen_geom.y(), screen_geom.x() + screen.size().width(), screen_geom.y() + screen.size().height()))
-            #    
-            #except Exception as e:
-            #    raise ScreenshotError('Pillow problem')
-
-        except Exception as err:
-            raise ScreenshotError(f'Pillow problem: {err}')
-        
+
+def _pillow_to_qimage(img) -> QImage:
+    if img.mode not in PILLOW_FORMATS:
         img = img.convert('RGB')
-        data = img.tobytes('raw', 'RGB')
-        qim = QImage(data, img.size[0], img.size[1], QImage.Format.Format_RGBA64_Premultiplied)
-        screen_pixmap = QPixmap.fromImage(qim)
-        screenshots.append((screen, screen_geom, screen_pixmap))
+    raw_mode, fmt = PILLOW_FORMATS[img.mode]
+    width, height = img.size
+    # One copy out of Pillow; the QImage wraps it and keeps a reference to it.
+    data = img.tobytes('raw', raw_mode)
+    return QImage(data, width, height, 4 * width, fmt)
+
+
+def _grab_pillow(_idx: int, screen_geom: QRect, size: QSize) -> QImage:
+    from PIL import ImageGrab, UnidentifiedImageError
+
+    try:
+        img = ImageGrab.grab(
+            bbox=(
+                screen_geom.x(), screen_geom.y(), 
+                screen_geom.x()+size.width(), screen_geom.y()+size.height()
+            ), 
+            xdisplay=""
+        )
     
-    return screenshots
+    except UnidentifiedImageError as err:
+        raise ScreenshotError(f'Pillow problem: {err}')
+
+    except Exception as err:
+        raise ScreenshotError(f'Pillow problem: {err}')
+
+    return _pillow_to_qimage(img)
+
+
+def _get_screenshots_pillow(screens: list[QScreen]) -> list[tuple[QScreen, QRect, QPixmap]]:
+    return [
+        (screen, screen_geom, QPixmap.fromImage(img))
+        for screen, (screen_geom, img) in zip(screens, _capture_concurrently('pillow', screens, _grab_pillow))
+    ]
 
 
 def _is_grim_installed():
-    try:
-        _ = subprocess.run('grim -h2', shell=True, 
-            stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
-            check=True)
-        return True
-    except:
-        return False
+    import shutil
+    return shutil.which('grim') is not None
     
 
 def _is_pillow_installed():
@@ -1033,43 +2529,168 @@ def _is_pillow_installed():
         return False
 
 
-def _get_screens(app: QApplication) -> list[tuple[QScreen, QRect, QPixmap]]:
-    screens = app.screens()
-    if len(screens) < 1:
-        raise ScreenshotError('No screens found')
-    
-    try:
-        if _is_pillow_installed():
-            return _get_screenshots_pillow(screens)
-        else:
-            raise ScreenshotError('Pillow problem: Pillow not installed.')
-    except ScreenshotError as err:
-        print(err)
+def _is_uniform(imgs: list[QImage]) -> bool:
+    """True if every pixel of every image has the same colour."""
+    import numpy as np
 
-    try:
-        if _is_grim_installed():
-            return _get_screenshots_grim(screens)
-        else:
-            raise ScreenshotError('Grim problem: Grim not installed.')
-    except ScreenshotError as err:
-        print(err)
+    first: int | None = None
+    for img in imgs:
+        if img.format() not in (QImage.Format.Format_RGB32, QImage.Format.Format_ARGB32,
+                                QImage.Format.Format_ARGB32_Premultiplied):
+            img = img.convertToFormat(IMAGE_FORMATS['ARGB32'])
+        if img.isNull():
+            continue
+
+        bits = img.constBits()
+        bits.setsize(img.sizeInBytes())
+        # Rows may be padded, so view them with the real stride and drop the padding.
+        pixels = np.frombuffer(bits, dtype=np.uint32).reshape(img.height(), img.bytesPerLine() // 4)[:, :img.width()]
+        if first is None:
+            first = int(pixels[0, 0])
+        if not (pixels == first).all():
+            return False
+    return True
+
+
+def _cache_dir() -> str:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'screenpen')
 
+
+class ProbeCache():
+    """Remembers which capture backend worked last time.
+
+    Entries are keyed by the session type, display and desktop, so the
+    backends are re-probed whenever the environment changes. Transparency is
+    not cached: it depends on whether a compositor is running right now.
+    """
+    def __init__(self, path: str | None = None) -> None:
+        self.path: str = path if path is not None else os.path.join(_cache_dir(), 'probes.json')
+        self.key: str = '|'.join(os.environ.get(var, '') for var in (
+            'XDG_SESSION_TYPE', 'WAYLAND_DISPLAY', 'DISPLAY', 'XDG_CURRENT_DESKTOP', 'DESKTOP_SESSION'
+        ))
+        self.lock: threading.Lock = threading.Lock()
+        try:
+            import json
+            with open(self.path) as fp:
+                self.entries: dict[str, dict[str, str | bool]] = json.load(fp)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, name: str) -> str | bool | None:
+        with self.lock:
+            return self.entries.get(self.key, {}).get(name)
+
+    def set(self, name: str, value: str | bool):
+        with self.lock:
+            entry = self.entries.setdefault(self.key, {})
+            if entry.get(name) == value:
+                return
+            entry[name] = value
+            self._write()
+
+    def remove(self, name: str):
+        with self.lock:
+            if self.entries.get(self.key, {}).pop(name, None) is not None:
+                self._write()
+
+    def _write(self):
+        # The cache is only an optimization, so failing to write it is fine.
+        try:
+            import json
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f'{self.path}.{os.getpid()}'
+            with open(tmp_path, 'w') as fp:
+                json.dump(self.entries, fp)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+
+def _get_screenshots_pyqt_checked(screens: list[QScreen]) -> tuple[list[tuple[QScreen, QRect, QPixmap]], bool]:
+    """The PyQt screenshots, and whether all of them are blank."""
     try:
-        screenshots = _get_screenshots_pyqt(app.screens())
+        screenshots = _get_screenshots_pyqt(screens)
         imgs: list[QImage] = [screenshot[-1].toImage() for screenshot in screenshots]
-        pxls = [img.pixel(i, j) for img in imgs for i in range(img.width()) for j in range(img.height())]
-        if [next(g, f := next(g, g)) == f for g in [groupby(pxls)]][0]:
-            print('Warning: All screens seems to be blank (e.g. black). It means your system configuration may not be supported.')
-        return screenshots
+        return screenshots, _is_uniform(imgs)
     except:
         raise Exception('Warning: Unable to take screenshots of your screens. Your system configuration may not be supported.')
 
 
+CAPTURE_BACKENDS: dict[str, tuple[Callable[[], bool], Callable[[list[QScreen]], list[tuple[QScreen, QRect, QPixmap]]], str]] = {
+    'pillow': (_is_pillow_installed, _get_screenshots_pillow, 'Pillow problem: Pillow not installed.'),
+    'grim': (_is_grim_installed, _get_screenshots_grim, 'Grim problem: Grim not installed.'),
+}
+
+
+def _get_screens(app: QApplication, cache: ProbeCache | None = None) -> list[tuple[QScreen, QRect, QPixmap]]:
+    screens = app.screens()
+    if len(screens) < 1:
+        raise ScreenshotError('No screens found')
+
+    cached = cache.get('capture_backend') if cache is not None else None
+    if cached == 'pyqt':
+        with PROFILER.phase('_get_screens[pyqt]'):
+            screenshots, blank = _get_screenshots_pyqt_checked(screens)
+        if not blank:
+            return screenshots
+        # A blank capture is what probing the other backends is for.
+        if cache is not None:
+            cache.remove('capture_backend')
+        cached = None
+
+    # Try the backend that worked last time without probing for it.
+    if cached in CAPTURE_BACKENDS:
+        try:
+            with PROFILER.phase(f'_get_screens[{cached}]'):
+                return CAPTURE_BACKENDS[str(cached)][1](screens)
+        except ScreenshotError as err:
+            print(err)
+
+    from concurrent.futures import ThreadPoolExecutor
+    others = [name for name in CAPTURE_BACKENDS if name != cached]
+    with PROFILER.phase('_get_screens probes'), \
+            ThreadPoolExecutor(max_workers=len(others), thread_name_prefix='screenpen-probe') as executor:
+        probes = {name: executor.submit(CAPTURE_BACKENDS[name][0]) for name in others}
+
+    for name in others:
+        _, capture, missing = CAPTURE_BACKENDS[name]
+        try:
+            if probes[name].result():
+                with PROFILER.phase(f'_get_screens[{name}]'):
+                    screenshots = capture(screens)
+                if cache is not None:
+                    cache.set('capture_backend', name)
+                return screenshots
+            else:
+                raise ScreenshotError(missing)
+        except ScreenshotError as err:
+            print(err)
+
+    with PROFILER.phase('_get_screens[pyqt]'):
+        screenshots, blank = _get_screenshots_pyqt_checked(screens)
+    if blank:
+        # Not cached, so the other backends are probed again next time.
+        print('Warning: All screens seems to be blank (e.g. black). It means your system configuration may not be supported.')
+    elif cache is not None:
+        cache.set('capture_backend', 'pyqt')
+    return screenshots
+
+
 def _is_transparency_supported():
+    with PROFILER.phase('_is_transparency_supported'):
+        return _probe_transparency()
+
+
+def _probe_transparency():
+    # Probed on every launch (concurrently with the capture), since a
+    # compositor can be started or stopped between runs.
+    import platform
+    import subprocess
     warn = 'INFO: Your system may support transparency but we cannot detect it. You may try to use -t parameter to force it.'
     try:
         if platform.system() == 'Linux':
-            return '_NET_WM_WINDOW_OPACITY' in subprocess.run("xprop -root", shell=True, stdout=subprocess.PIPE).stdout.decode()
+            return '_NET_WM_WINDOW_OPACITY' in subprocess.run(['xprop', '-root'], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode()
         else:
             print(warn)
             return False
@@ -1097,23 +2718,180 @@ def _setPalette(app: QApplication):
     _ = app.setStyle("Fusion")
 
 
-def main():
-    import argparse
-
-    parser = argparse.ArgumentParser(description='Process some integers.')
-    _ = parser.add_argument('-v', '--version', dest='version', action='version', version=f'Version: {__version__}')
-    _ = parser.add_argument('-1', nargs='?', type=int, dest='screen', const='0')
-    _ = parser.add_argument('-2', nargs='?', type=int, dest='screen', const='1')
-    _ = parser.add_argument('-3', nargs='?', type=int, dest='screen', const='2')
-    _ = parser.add_argument('-t', '--transparent', dest='transparent', help='Force transparent background. If you are sure your WM support it.', action='store_true')
-    _ = parser.add_argument('-c', '--config', type=str, dest='config', help='Path to config file', default='')
-
-    args = parser.parse_args()
-
-    app = QApplication(sys.argv)
+type TraceRecord = tuple[int, int, float, tuple[int, int, int, int] | list]
+
+
+def _read_trace(path: str) -> tuple[dict, list[TraceRecord]]:
+    import json
+    import struct
+    record, mouse, length = struct.Struct(TRACE_RECORD), struct.Struct(TRACE_MOUSE), struct.Struct(TRACE_LENGTH)
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    if not data.startswith(TRACE_MAGIC):
+        raise Exception(f'Error: {path} is not a screenpen trace')
+
+    offset = len(TRACE_MAGIC)
+    (size,) = length.unpack_from(data, offset)
+    offset += length.size
+    header = json.loads(data[offset:offset + size])
+    offset += size
+
+    records: list[TraceRecord] = []
+    # A session that crashed may have left a partial record at the end.
+    while offset + record.size <= len(data):
+        kind, window, t = record.unpack_from(data, offset)
+        offset += record.size
+        if kind == TRACE_ACTION:
+            if offset + length.size > len(data):
+                break
+            (size,) = length.unpack_from(data, offset)
+            offset += length.size
+            if offset + size > len(data):
+                break
+            payload = json.loads(data[offset:offset + size])
+            offset += size
+        else:
+            if offset + mouse.size > len(data):
+                break
+            payload = mouse.unpack_from(data, offset)
+            offset += mouse.size
+        records.append((kind, window, t, payload))
+    return header, records
+
+
+def _percentiles(times: list[float]) -> dict[str, float] | None:
+    if not times:
+        return None
+    ms = sorted(1000 * t for t in times)
+    pick = lambda q: ms[min(len(ms) - 1, int(q * len(ms)))]
+    return {'count': len(ms), 'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': ms[-1], 'mean': sum(ms) / len(ms)}
+
+
+def _replay_trace(path: str, realtime: bool = False, config_file: str | None = None) -> dict:
+    """Replays a --record-trace session, headless unless QT_QPA_PLATFORM is
+    set, and returns frame times (input event to painted frame) and memory use."""
+    import tempfile
+    header, records = _read_trace(path)
+
+    with tempfile.TemporaryDirectory(prefix='screenpen-replay-') as tmp:
+        if 'QT_QPA_PLATFORM' not in os.environ:
+            import json
+            screens_path = os.path.join(tmp, 'screens.json')
+            with open(screens_path, 'w') as fp:
+                json.dump({'screens': [
+                    {'name': f'trace-{idx}', 'x': x, 'y': y, 'width': w, 'height': h, 'logicalDpi': 96, 'logicalBpi': 96, 'dpr': dpr}
+                    for idx, (x, y, w, h, dpr) in enumerate(header['screens'])
+                ]}, fp)
+            os.environ['QT_QPA_PLATFORM'] = f'offscreen:configfile={screens_path}'
+        app = QApplication(sys.argv)
     _setPalette(app)
 
-    screens_data = _get_screens(app)
+    shared = SharedState(config_file)
+    windows: list[ScreenPenWindow] = []
+    for idx, (x, y, w, h, dpr) in enumerate(header['screens']):
+        screens = app.screens()
+        screen = screens[idx] if idx < len(screens) else app.primaryScreen()
+        pixmap = QPixmap(round(w * dpr), round(h * dpr))
+        pixmap.fill(COLORS['darkGray'])
+        windows.append(ScreenPenWindow(screen, QRect(x, y, w, h), pixmap, transparent_background=header['transparent'],
+                                       config_file=config_file, shared=shared, toolbars=idx == 0))
+    app.processEvents()
+
+    event_types = {
+        TRACE_PRESS: (QtCore.QEvent.Type.MouseButtonPress, 'mousePressEvent', 'press'),
+        TRACE_MOVE: (QtCore.QEvent.Type.MouseMove, 'mouseMoveEvent', 'move'),
+        TRACE_RELEASE: (QtCore.QEvent.Type.MouseButtonRelease, 'mouseReleaseEvent', 'release'),
+    }
+    times: dict[str, list[float]] = {'press': [], 'move': [], 'release': [], 'action': []}
+    skipped: list[str] = []
+    last_frame: dict[int, float] = {}
+    start = time.monotonic()
+    for kind, idx, t, payload in records:
+        if realtime:
+            delay = t - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        window = windows[idx]
+
+        event_start = time.perf_counter()
+        if kind == TRACE_ACTION:
+            name, args, kwargs = payload
+            # Saving would write files and quitting would end the replay.
+            if name in ['saveDrawing', 'quit_program']:
+                skipped.append(name)
+                continue
+            result = getattr(window, name)(*[_decode_trace_arg(arg) for arg in args],
+                                           **{key: _decode_trace_arg(arg) for key, arg in kwargs.items()})
+            if callable(result):
+                result()
+            label = 'action'
+        else:
+            event_type, handler, label = event_types[kind]
+            x, y, button, buttons = payload
+            # A right click quits, see mousePressEvent.
+            if kind == TRACE_PRESS and button == BUTTONS['right'].value:
+                skipped.append('quit_program')
+                continue
+            pos = QPointF(x, y)
+            getattr(window, handler)(QMouseEvent(event_type, pos, pos, Qt.MouseButton(button), Qt.MouseButton(buttons),
+                                                 Qt.KeyboardModifier.NoModifier))
+            # Without real time pacing the frame timer never fires between
+            # events, so frames are flushed at the recorded refresh interval.
+            if kind == TRACE_MOVE and not realtime and t - last_frame.get(idx, -1.0) >= window.frame_interval:
+                window.flushInput()
+                last_frame[idx] = t
+        app.processEvents()
+        times[label].append(time.perf_counter() - event_start)
+
+    report = {
+        'trace': path,
+        'events': len(records),
+        'skipped': skipped,
+        'recorded_s': records[-1][2] if records else 0.0,
+        'replay_s': time.monotonic() - start,
+        'frame_ms': {label: _percentiles(values) for label, values in times.items()},
+        'history_bytes': [window._history.nbytes() if window._history is not None else 0 for window in windows],
+        'tiles': [len(window.imageDraw.tiles) for window in windows],
+        'input_frames': [window.input_frames for window in windows],
+    }
+    try:
+        import resource
+        # ru_maxrss is in KiB on Linux and in bytes on macOS.
+        report['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+    except ImportError:
+        pass
+    return report
+
+
+def run(args: 'argparse.Namespace'):
+    """Starts a new instance; screenpen.client.main has parsed `args` and found none running."""
+    if args.replay_trace is not None:
+        import json
+        print(json.dumps(_replay_trace(args.replay_trace, args.realtime, args.config or None), indent=2))
+        sys.exit(0)
+
+    if args.profile_startup is not None:
+        PROFILER.enabled = True
+        PROFILER.record('module imports', _IMPORT_START, _IMPORT_END)
+
+    # Every pointer position is needed for smooth strokes; the windows batch
+    # them per frame themselves, see flushInput().
+    QApplication.setAttribute(APP_ATTRS['compressHighFrequencyEvents'], False)
+    with PROFILER.phase('QApplication'):
+        app = QApplication(sys.argv)
+    with PROFILER.phase('InstanceServer'):
+        # Taken before the slow capture, see InstanceServer.
+        server = InstanceServer(app, None if args.daemon else 'show')
+    with PROFILER.phase('_setPalette'):
+        _setPalette(app)
+
+    from concurrent.futures import ThreadPoolExecutor
+    cache = ProbeCache()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='screenpen-probe') as executor:
+        # The transparency probe does not need Qt, so it runs while the screens are captured.
+        transparency = executor.submit(_is_transparency_supported) if not args.transparent else None
+        screens_data = _get_screens(app, cache)
+        use_transparency = args.transparent or (transparency is not None and transparency.result())
 
     if args.screen is None:
         screen_choice: int = 0
@@ -1128,58 +2906,35 @@ def main():
     else:
         config_path: str | None = None
     
-    screen: QScreen
-    screen_geom: QRect
-    pixmap: QPixmap
-    screen, screen_geom, pixmap = screens_data[screen_choice]
-    
-    use_transparency = args.transparent or _is_transparency_supported()
-
-    _ = ScreenPenWindow(screen=screen, screen_geom=screen_geom, pixmap=pixmap,
-                             transparent_background=use_transparency, config_file=config_path)
-    sys.exit(_execute_dialog(app))
-
-
-class DrawingHistory():
-        def __init__(self, limit: int = 4):
-            self.history: list[QPixmap] = []
-            self.limit: int = limit
-            self.current: int = -1
-        
-        def append(self, el: QPixmap):
-            if self.current < len(self.history):
-                del self.history[self.current + 1:]
-                
-            if len(self.history) >= self.limit:
-                del self.history[0]
-                self.current = self.limit - 2
-
-            self.history.append(el)
-            self.current += 1
-            
-        def extend(self, l: Iterable[QPixmap]):
-            self.history.extend(l)
-            
-        def undo(self) -> QPixmap:
-            if self.current > 0:
-                self.current -= 1
-            return self.history[self.current]
-        
-        def redo(self):
-            if self.current + 1 < len(self.history):
-                self.current += 1
-            return self.history[self.current]
-
-        def len(self) -> int:
-            return len(self.history)
-
-        def __getitem__(self, key: int) -> QPixmap:
-            try:
-                return self.history[-key]
-
-            except KeyError:
-                print(f"Error: Invalid key in history ({key})")
-                sys.exit(-2)
+    # The screen with the toolbars comes first; the other screens only get a bare overlay.
+    chosen = [screen_choice] + ([idx for idx in range(len(screens_data)) if idx != screen_choice] if args.all_screens else [])
+    shared = SharedState(config_path)
+    windows: list[ScreenPenWindow] = []
+    for idx in chosen:
+        screen, screen_geom, pixmap = screens_data[idx]
+        windows.append(ScreenPenWindow(screen=screen, screen_geom=screen_geom, pixmap=pixmap,
+                                       transparent_background=use_transparency, config_file=config_path,
+                                       show=not args.daemon, shared=shared, toolbars=idx == screen_choice))
+
+    if args.record_trace is not None:
+        shared.trace = TraceRecorder(args.record_trace, windows, use_transparency)
+
+    capture: Callable[[], list[QPixmap]] | None = None
+    if args.daemon:
+        for window in windows:
+            window.resident = True
+        app.setQuitOnLastWindowClosed(False)
+        if not use_transparency:
+            def _capture_chosen() -> list[QPixmap]:
+                # One capture of all screens per show, indexed per window.
+                captured = _get_screens(app, cache)
+                return [captured[idx][2] for idx in chosen]
+            capture = _capture_chosen
+    server.attach(windows, capture)
+    ret = _execute_dialog(app)
+    if args.profile_startup is not None:
+        PROFILER.report(args.profile_startup)
+    sys.exit(ret)
 
 
 class Configuration():
@@ -1190,6 +2945,11 @@ class Configuration():
         "hidden_menus": "bool",
         "icon_size": "int",
         "drawing_history": "int",
+        "history_memory_mb": "int",
+        "stroke_tolerance": "float",
+        "save_format": "str",
+        "save_compression": "int",
+        "save_directory": "str",
         "default_pen_size": "int",
         "undo_key": "str",
         "redo_key": "str",
@@ -1205,13 +2965,18 @@ class Configuration():
         "drawing_mouse": "str"
     }
 
-    __default_config: dict[str, str | bool | int] = {
+    __default_config: dict[str, str | bool | int | float] = {
         "penbar_area": "topToolBarArea",
         "boardbar_area": "topToolBarArea",
         "actionbar_area": "leftToolBarArea",
         "hidden_menus": False,
         "icon_size": 25,
         "drawing_history": 50,
+        "history_memory_mb": 256,
+        "stroke_tolerance": 1.0,
+        "save_format": "png",
+        "save_compression": -1,
+        "save_directory": "",
         "default_pen_size": 3,
         "undo_key": "Ctrl+z",
         "redo_key": "Ctrl+y",
@@ -1228,7 +2993,7 @@ class Configuration():
     }
 
     def __init__(self, config_path: str | None = None) -> None:
-        self.config: dict[str, str | bool | int] = {}
+        self.config: dict[str, str | bool | int | float] = {}
 
         default_config_path = os.path.join(os.environ["XDG_CONFIG_HOME"], "screenpenrc")
         dir_path = os.path.dirname(os.path.realpath(__file__))
@@ -1262,6 +3027,7 @@ class Configuration():
             self.config = self.__default_config
             return
 
+        import configparser
         config = configparser.ConfigParser()
         _ = config.read(self.config_path)
 
@@ -1279,6 +3045,12 @@ class Configuration():
                         temp = self.__default_config[key]
                     self.config[key] = temp
 
+                case "float":
+                    temp = config['screenpen'].getfloat(key)
+                    if temp is None:
+                        temp = self.__default_config[key]
+                    self.config[key] = temp
+
                 case "str":
                     temp = config['screenpen'].get(key)
                     if temp is None:
@@ -1287,11 +3059,16 @@ class Configuration():
                 
                 case _:
                     raise Exception("Error in parsing config. Nonexistant key type.")
-        
+
+        save_format = str(self.config["save_format"]).lower()
+        if save_format not in SAVE_FORMATS:
+            print(f"Warning: Unknown save_format ({save_format}), saving as png.")
+            save_format = "png"
+        self.config["save_format"] = save_format
         return
 
     
-    def __getitem__(self, key: str) -> str | bool | int:
+    def __getitem__(self, key: str) -> str | bool | int | float:
         try:
             return self.config[key]
         except KeyError:
@@ -1299,20 +3076,107 @@ class Configuration():
             sys.exit(-2)
 
 
-def check_already_running():
-    curr_proc = psutil.Process()
-    curr_command = curr_proc.cmdline()
-    for proc in psutil.process_iter():
-        try:
-            temp_command = proc.cmdline()
-
-        except psutil.ZombieProcess:
-            continue
-        
-        if curr_command == temp_command and proc.pid != curr_proc.pid:
-            sys.exit(-3)
+def _peer_uid(descriptor: int) -> int | None:
+    """User id of the process on the other end of a local socket, None where the platform does not tell."""
+    import socket
+    import struct
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    credentials = struct.Struct('3i')  # pid, uid, gid
+    with socket.socket(fileno=os.dup(descriptor)) as peer:
+        _, uid, _ = credentials.unpack(peer.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, credentials.size))
+    return uid
+
+
+class InstanceServer(QObject):
+    """Listens for commands from later invocations of screenpen.
+
+    It is created before the screens are captured, so that of two instances
+    started together only one keeps the socket; the windows are attached once
+    they exist, commands sent before that wait in the server's queue.
+    `capture` returns fresh screenshots, one per window, for the `show`
+    command; it is None when the windows have a transparent background.
+    The first window is the one with the toolbars.
+    """
+    def __init__(self, parent: QObject, command: str | None = None):
+        super().__init__(parent)
+        self.windows: list[ScreenPenWindow] = []
+        self.window: ScreenPenWindow | None = None
+        self.capture: Callable[[], list[QPixmap]] | None = None
+        from PyQt6.QtNetwork import QLocalServer
+        self.server: QLocalServer = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+
+        if not self.server.listen(instance_name()):
+            # Another instance may have started since screenpen.client checked;
+            # it gets `command` and this one exits. Only a socket nobody answers
+            # on is stale and may be removed.
+            check_already_running(command)
+            _ = QLocalServer.removeServer(instance_name())
+            if not self.server.listen(instance_name()):
+                print(f'Warning: Could not listen for other instances: {self.server.errorString()}')
+
+    def attach(self, windows: list[ScreenPenWindow], capture: Callable[[], list[QPixmap]] | None = None):
+        self.windows = windows
+        self.window = windows[0]
+        self.capture = capture
+        _ = self.server.newConnection.connect(self._onNewConnection)
+        self._onNewConnection()
+
+    def _onNewConnection(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            uid = _peer_uid(int(socket.socketDescriptor()))
+            if uid is not None and uid != os.getuid():
+                print(f'Warning: Ignoring a connection from another user (uid {uid})')
+                socket.abort()
+                socket.deleteLater()
+                continue
+            _ = socket.readyRead.connect(lambda socket=socket: self._read(socket))
+            _ = socket.disconnected.connect(socket.deleteLater)
+            # A connection queued before attach() may have sent and closed already.
+            self._read(socket)
+            if socket.state() == socket.LocalSocketState.UnconnectedState:
+                socket.deleteLater()
+
+    def _read(self, socket: 'QLocalSocket'):
+        while socket.canReadLine():
+            self.dispatch(bytes(socket.readLine()).decode().strip())
+
+    def dispatch(self, command: str):
+        if self.window is None:
+            return
+        match command:
+            case 'show':
+                if self.window.isVisible():
+                    self.window.raise_()
+                    self.window.activateWindow()
+                else:
+                    pixmaps = self.capture() if self.capture is not None else [None] * len(self.windows)
+                    for window, pixmap in zip(self.windows, pixmaps):
+                        window.present(pixmap)
+                    self.window.activateWindow()
+            case 'toggle_menus':
+                self.window.toggle_menus()
+            case 'clear':
+                for window in self.windows:
+                    window.removeDrawing()()
+            case 'save':
+                # Screens that were never drawn on are skipped.
+                for window in self.windows:
+                    if window is self.window or window._history is not None:
+                        window.saveDrawing()()
+            case 'undo':
+                (self.window.shared.active or self.window).undo()
+            case 'redo':
+                (self.window.shared.active or self.window).redo()
+            case 'quit':
+                self.window.quit_program()
+            case 'stop':
+                QApplication.quit()
+            case _:
+                print(f'Warning: Unknown command from another instance ({command})')
 
 
 if __name__ == '__main__':
-    check_already_running()
     main()